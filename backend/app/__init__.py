@@ -0,0 +1,5 @@
+import os
+
+# Read when torch first initializes CUDA, so it is set before any model module imports torch.
+# Expandable segments let BLIP, CLIP and YOLO grow one shared pool instead of fragmenting fixed blocks.
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
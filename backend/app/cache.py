@@ -1,33 +1,115 @@
+import asyncio
 import hashlib
 import json
 import time
-from typing import Any, Dict, Optional
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
 import logging
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+    orjson_available = True
+except ImportError:
+    orjson_available = False
+
+try:
+    import xxhash
+    xxhash_available = True
+except ImportError:
+    xxhash_available = False
+
+def new_digest():
+    """Create a 128-bit hasher for cache keys (non-cryptographic XXH3 when available)"""
+    if xxhash_available:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+def hexdigest(data: bytes) -> str:
+    """Hash bytes in one shot with the cache-key hasher"""
+    if xxhash_available:
+        return xxhash.xxh3_128_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+class ComputationAbandoned(Exception):
+    """The request computing a shared cache entry was cancelled before producing it"""
+
+class FrequencySketch:
+    """Approximate per-key access counts (count-min sketch) with periodic aging"""
+    
+    def __init__(self, width: int, depth: int = 4, max_count: int = 15):
+        self.width = max(width, 16)
+        self.depth = depth
+        self.max_count = max_count
+        self.table = [[0] * self.width for _ in range(depth)]
+        self.additions = 0
+        self.sample_size = 10 * self.width
+    
+    def _indexes(self, key: str):
+        h = hash(key)
+        return [(row, hash((h, row)) % self.width) for row in range(self.depth)]
+    
+    def increment(self, key: str) -> None:
+        """Record one access to key"""
+        for row, idx in self._indexes(key):
+            if self.table[row][idx] < self.max_count:
+                self.table[row][idx] += 1
+        
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._age()
+    
+    def estimate(self, key: str) -> int:
+        """Estimated number of recent accesses to key"""
+        return min(self.table[row][idx] for row, idx in self._indexes(key))
+    
+    def _age(self) -> None:
+        # Halve all counters so old popularity fades out
+        for row in self.table:
+            row[:] = [count >> 1 for count in row]
+        self.additions //= 2
+    
+    def clear(self) -> None:
+        for row in self.table:
+            row[:] = [0] * self.width
+        self.additions = 0
+
 class MemoryCache:
-    """Simple in-memory cache for API responses"""
+    """Bounded in-memory LRU cache with TinyLFU admission and per-entry TTL for API responses"""
     
-    def __init__(self, default_ttl: int = 300):  # 5 minutes default
-        self.cache: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, default_ttl: int = 300, maxsize: int = 1024):  # 5 minutes default
+        self.cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
         self.default_ttl = default_ttl
+        self.maxsize = maxsize
+        self.sketch = FrequencySketch(width=maxsize)
+        # Keys currently being computed, so concurrent misses share one computation
+        self.inflight: Dict[str, asyncio.Future] = {}
     
     def _generate_key(self, data: Any) -> str:
         """Generate a cache key from data"""
-        if isinstance(data, bytes):
-            # For image data, use hash
-            return hashlib.md5(data).hexdigest()
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            # For image data, hash the raw bytes directly
+            return hexdigest(data)
+        
+        # For other data, serialize canonically and hash
+        if orjson_available:
+            serialized = orjson.dumps(data, option=orjson.OPT_SORT_KEYS, default=str)
         else:
-            # For other data, serialize and hash
-            serialized = json.dumps(data, sort_keys=True, default=str)
-            return hashlib.md5(serialized.encode()).hexdigest()
+            serialized = json.dumps(data, sort_keys=True, default=str).encode()
+        return hexdigest(serialized)
     
-    def get(self, key: str) -> Optional[Any]:
-        """Get item from cache"""
+    def get(self, key: str, now: Optional[float] = None) -> Optional[Any]:
+        """Get item from cache (``now`` is a monotonic timestamp such as ``loop.time()``)"""
+        self.sketch.increment(key)
+        
         if key in self.cache:
             entry = self.cache[key]
-            if time.time() < entry['expires_at']:
+            if now is None:
+                now = time.monotonic()
+            if now < entry['expires_at']:
+                self.cache.move_to_end(key)
                 logger.info(f"Cache hit for key: {key[:10]}...")
                 return entry['data']
             else:
@@ -36,10 +118,22 @@ class MemoryCache:
                 logger.info(f"Cache expired for key: {key[:10]}...")
         return None
     
-    def set(self, key: str, data: Any, ttl: Optional[int] = None) -> None:
+    def set(self, key: str, data: Any, ttl: Optional[int] = None, now: Optional[float] = None) -> None:
         """Set item in cache"""
         ttl = ttl or self.default_ttl
-        expires_at = time.time() + ttl
+        if now is None:
+            now = time.monotonic()
+        expires_at = now + ttl
+        
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        elif len(self.cache) >= self.maxsize:
+            victim_key, victim = next(iter(self.cache.items()))
+            # Only displace a live LRU victim if the newcomer is accessed at least as often
+            if now < victim['expires_at'] and self.sketch.estimate(key) < self.sketch.estimate(victim_key):
+                logger.info(f"Cache admission rejected for key: {key[:10]}...")
+                return
+            self.cache.popitem(last=False)
         
         self.cache[key] = {
             'data': data,
@@ -47,31 +141,106 @@ class MemoryCache:
         }
         logger.info(f"Cached data for key: {key[:10]}... (TTL: {ttl}s)")
     
+    def get_inflight(self, key: str) -> Optional[asyncio.Future]:
+        """Get the pending computation for key, if another request has started one"""
+        return self.inflight.get(key)
+    
+    def start_inflight(self, key: str) -> asyncio.Future:
+        """Register the caller as the producer for key until finish_inflight is called"""
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        return future
+    
+    def finish_inflight(
+        self,
+        key: str,
+        data: Any = None,
+        error: Optional[BaseException] = None,
+        ttl: Optional[int] = None
+    ) -> None:
+        """Publish the result for key to waiting requests and cache it on success"""
+        future = self.inflight.pop(key, None)
+        
+        if error is None:
+            self.set(key, data, ttl)
+        
+        if future is None or future.done():
+            return
+        if error is None:
+            future.set_result(data)
+        else:
+            future.set_exception(error)
+            # Mark as retrieved so an unobserved failure isn't logged as a leak
+            future.exception()
+    
+    def abandon_inflight(self, key: str) -> None:
+        """Drop the pending computation for key, telling its waiters to compute it themselves"""
+        future = self.inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_exception(ComputationAbandoned(key))
+            future.exception()
+    
+    async def get_or_compute(self, key: str, factory: Callable[[], Awaitable[Any]], ttl: Optional[int] = None) -> Any:
+        """Get item from cache, computing it once even when many requests miss at the same time"""
+        while True:
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+            
+            pending = self.get_inflight(key)
+            if pending is None:
+                break
+            try:
+                # Shield so a cancelled waiter doesn't cancel the shared computation
+                return await asyncio.shield(pending)
+            except ComputationAbandoned:
+                # The producer was cancelled (e.g. its client disconnected); take over
+                continue
+        
+        self.start_inflight(key)
+        try:
+            data = await factory()
+        except Exception as e:
+            self.finish_inflight(key, error=e)
+            raise
+        except BaseException:
+            # Cancellation belongs to this request only, never publish it to the waiters
+            self.abandon_inflight(key)
+            raise
+        
+        self.finish_inflight(key, data, ttl=ttl)
+        return data
+    
     def clear(self) -> None:
         """Clear all cached items"""
         self.cache.clear()
+        self.sketch.clear()
         logger.info("Cache cleared")
     
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
+        now = time.monotonic()
         total_items = len(self.cache)
-        expired_items = sum(1 for entry in self.cache.values() if time.time() >= entry['expires_at'])
+        expired_items = sum(1 for entry in self.cache.values() if now >= entry['expires_at'])
         
         return {
+            'max_items': self.maxsize,
             'total_items': total_items,
             'active_items': total_items - expired_items,
             'expired_items': expired_items
         }
 
 # Global cache instance
-cache = MemoryCache(default_ttl=600)  # 10 minutes default
+cache = MemoryCache(default_ttl=600, maxsize=settings.cache_max_items)  # 10 minutes default
 
-def cache_key_from_image(image_data: bytes, additional_params: Dict = None) -> str:
-    """Generate cache key for image-based operations"""
-    base_key = cache._generate_key(image_data)
-    
+def cache_key_from_hash(image_hash: str, additional_params: Dict = None) -> str:
+    """Generate cache key from an already computed image digest"""
     if additional_params:
         params_key = cache._generate_key(additional_params)
-        return f"{base_key}_{params_key}"
+        return f"{image_hash}_{params_key}"
     
-    return base_key
\ No newline at end of file
+    return image_hash
+
+def cache_key_from_image(image_data: bytes, additional_params: Dict = None) -> str:
+    """Generate cache key for image-based operations"""
+    return cache_key_from_hash(cache._generate_key(image_data), additional_params)
@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import List, Tuple
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -19,9 +19,12 @@ class Settings:
         self.port: int = int(os.getenv("PORT", "8000"))
         
         # CORS Configuration
-        self.allowed_origins: List[str] = os.getenv("ALLOWED_ORIGINS", "*").split(",")
+        self.allowed_origins: Tuple[str, ...] = tuple(
+            origin.strip() for origin in os.getenv("ALLOWED_ORIGINS", "*").split(",") if origin.strip()
+        )
         self.allowed_methods: List[str] = ["GET", "POST", "PUT", "DELETE"]
         self.allowed_headers: List[str] = ["*"]
+        self.gzip_minimum_size: int = int(os.getenv("GZIP_MINIMUM_SIZE", "500"))  # bytes
         
         # API Keys
         self.huggingface_token: str = os.getenv("HUGGINGFACE_TOKEN", "")
@@ -30,10 +33,59 @@ class Settings:
         # Model Configuration
         self.blip_model_name: str = os.getenv("BLIP_MODEL_NAME", "Salesforce/blip-image-captioning-base")
         self.max_image_size: int = int(os.getenv("MAX_IMAGE_SIZE", str(10 * 1024 * 1024)))  # 10MB
+        self.max_image_pixels: int = int(os.getenv("MAX_IMAGE_PIXELS", str(50_000_000)))  # ~7000x7000
+        self.max_concurrent_captions: int = int(os.getenv("MAX_CONCURRENT_CAPTIONS", "4"))
+        self.torch_compile: bool = os.getenv("TORCH_COMPILE", "false").lower() == "true"
+        self.torch_threads: int = int(os.getenv("TORCH_THREADS", "0"))  # 0 = PyTorch default (one per physical core)
+        self.preprocess_workers: int = int(os.getenv("PREPROCESS_WORKERS", "0"))  # 0 = decode in threads
+        self.caption_workers: int = int(os.getenv("CAPTION_WORKERS", "0"))  # 0 = caption in this process
+        self.caption_num_beams: int = int(os.getenv("CAPTION_NUM_BEAMS", "5"))
+        self.caption_int8: bool = os.getenv("CAPTION_INT8", "false").lower() == "true"  # CPU only
+        self.clip_int8: bool = os.getenv("CLIP_INT8", "false").lower() == "true"  # CPU only
+        self.yolo_model: str = os.getenv("YOLO_MODEL", "yolov8n.pt")  # .pt or a previously exported model
+        self.yolo_int8_export: str = os.getenv("YOLO_INT8_EXPORT", "")  # "openvino" (CPU) or "engine" (TensorRT)
+        self.yolo_calibration_data: str = os.getenv("YOLO_CALIBRATION_DATA", "coco128.yaml")
         
         # Search Configuration
         self.default_search_count: int = int(os.getenv("DEFAULT_SEARCH_COUNT", "10"))
         self.max_search_count: int = int(os.getenv("MAX_SEARCH_COUNT", "50"))
+        self.pixabay_cache_ttl: int = int(os.getenv("PIXABAY_CACHE_TTL", "300"))  # seconds
+        self.pixabay_cache_max_items: int = int(os.getenv("PIXABAY_CACHE_MAX_ITEMS", "2048"))
+        self.ann_min_items: int = int(os.getenv("ANN_MIN_ITEMS", "50000"))  # below this, search stays exact
+        self.hnsw_m: int = int(os.getenv("HNSW_M", "32"))
+        self.hnsw_ef_search: int = int(os.getenv("HNSW_EF_SEARCH", "64"))
+        self.embedding_storage: str = os.getenv("EMBEDDING_STORAGE", "float32")  # float32, float16 or int8
+        
+        # Cache Configuration
+        self.cache_max_items: int = int(os.getenv("CACHE_MAX_ITEMS", "1024"))
+        self.redis_url: str = os.getenv("REDIS_URL", "")  # empty = in-process cache only
+        self.redis_max_connections: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+        self.llm_cache_ttl: int = int(os.getenv("LLM_CACHE_TTL", "3600"))  # seconds
+        self.caption_cache_ttl: int = int(os.getenv("CAPTION_CACHE_TTL", "86400"))  # seconds
+        self.embedding_cache_ttl: int = int(os.getenv("EMBEDDING_CACHE_TTL", "604800"))  # seconds
+        self.semantic_cache_enabled: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+        self.semantic_cache_model: str = os.getenv("SEMANTIC_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+        self.semantic_cache_onnx_path: str = os.getenv("SEMANTIC_CACHE_ONNX_PATH", "")  # e.g. an int8-quantized export
+        self.semantic_cache_threshold: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+        self.semantic_cache_max_items: int = int(os.getenv("SEMANTIC_CACHE_MAX_ITEMS", "512"))  # per bucket, in-process only
+        
+        # Micro-batching: requests arriving within *_BATCH_MAX_DELAY_MS share one model/API call
+        self.detect_batch_max_size: int = int(os.getenv("DETECT_BATCH_MAX_SIZE", "8"))
+        self.detect_batch_max_delay_ms: float = float(os.getenv("DETECT_BATCH_MAX_DELAY_MS", "20"))
+        self.caption_batch_max_size: int = int(os.getenv("CAPTION_BATCH_MAX_SIZE", "8"))
+        self.caption_batch_max_delay_ms: float = float(os.getenv("CAPTION_BATCH_MAX_DELAY_MS", "20"))
+        self.ocr_batch_max_size: int = int(os.getenv("OCR_BATCH_MAX_SIZE", "8"))
+        self.ocr_batch_max_delay_ms: float = float(os.getenv("OCR_BATCH_MAX_DELAY_MS", "20"))
+        self.gemini_batch_max_size: int = int(os.getenv("GEMINI_BATCH_MAX_SIZE", "16"))
+        self.gemini_batch_max_delay_ms: float = float(os.getenv("GEMINI_BATCH_MAX_DELAY_MS", "20"))
+        
+        # Upstream APIs
+        self.gemini_max_concurrency: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+        self.pixabay_max_concurrency: int = int(os.getenv("PIXABAY_MAX_CONCURRENCY", "8"))
+        self.upstream_max_retries: int = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+        self.http_max_connections: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.http_max_keepalive: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "50"))
+        self.gemini_prefix_warmup: bool = os.getenv("GEMINI_PREFIX_WARMUP", "false").lower() == "true"
         
         # Rate Limiting
         self.rate_limit_requests: int = int(os.getenv("RATE_LIMIT_REQUESTS", "100"))
@@ -1,7 +1,10 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
 import logging
+import logging.handlers
+import queue
 import sys
 import os
 
@@ -10,14 +13,27 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.routers import analyze, search, llm, visual_intelligence, batch
 from app.config import settings
+from app.responses import AppJSONResponse, StaticJSON
+from app.services.redis_cache import close_redis
+from app.services.http_client import close_http_client
+from app.services import semantic_cache
+from app.services.llm_service import warm_prompt_prefixes
+from app.services.caption import shutdown_preprocess_pool, shutdown_caption_pool
+from app.utils.torch_threads import configure_cpu_threads
+
+# Configure logging: handlers only enqueue records, a background thread does the formatting and I/O
+log_handler = logging.StreamHandler(sys.stdout)
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_queue: queue.Queue = queue.Queue(-1)
+log_listener = logging.handlers.QueueListener(log_queue, log_handler, respect_handler_level=True)
+log_listener.start()
 
-# Configure logging
 logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=settings.log_level,
     handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
+        logging.handlers.QueueHandler(log_queue)
+    ],
+    force=True  # replace handlers installed by modules imported above
 )
 
 logger = logging.getLogger(__name__)
@@ -28,10 +44,20 @@ async def lifespan(app: FastAPI):
     logger.info(" Starting AI Lens API...")
     logger.info(f" Version: {settings.app_version}")
     logger.info(f" Debug mode: {settings.debug}")
+    configure_cpu_threads()
+    if semantic_cache.is_enabled():
+        semantic_cache.load_embedder()
+    if settings.gemini_prefix_warmup:
+        await warm_prompt_prefixes()
     logger.info("API is ready!")
     yield
     # Shutdown
     logger.info(" Shutting down AI Lens API...")
+    await close_redis()
+    await close_http_client()
+    shutdown_preprocess_pool()
+    shutdown_caption_pool()
+    log_listener.stop()
 
 # Create FastAPI app
 app = FastAPI(
@@ -40,6 +66,7 @@ app = FastAPI(
     version=settings.app_version,
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=AppJSONResponse,
     lifespan=lifespan
 )
 
@@ -52,6 +79,9 @@ app.add_middleware(
     allow_headers=settings.allowed_headers,
 )
 
+# Compress JSON responses (search results repeat the same keys for every image)
+app.add_middleware(GZipMiddleware, minimum_size=settings.gzip_minimum_size)
+
 # Include routers
 app.include_router(visual_intelligence.router, prefix="/visual", tags=["🍎 Visual Intelligence"])
 app.include_router(batch.router, prefix="/batch", tags=[" Batch Processing"])
@@ -59,58 +89,66 @@ app.include_router(analyze.router, prefix="/analyze", tags=[" Image Analysis"])
 app.include_router(search.router, prefix="/search", tags=[" Image Search"])
 app.include_router(llm.router, prefix="/llm", tags=[" LLM Services"])
 
+# Static payloads are built once at import instead of on every request
+_ROOT_PAYLOAD = {
+    "message": " AI Lens - Visual Intelligence API",
+    "inspiration": "Apple Visual Intelligence",
+    "version": settings.app_version,
+    "docs": "/docs",
+    "features": {
+        "visual_intelligence": " Comprehensive image analysis like Apple's system",
+        "quick_scan": " Instant analysis for immediate results",
+        "smart_search": " Contextual search based on image content",
+        "batch_processing": " Analyze multiple images simultaneously", 
+        "image_comparison": " Compare and find duplicate images",
+        "shopping": " Find similar products to buy",
+        "text_recognition": " Extract and translate text",
+        "nature_id": " Identify plants and animals",
+        "food_analysis": " Analyze food and nutrition",
+        "landmark_recognition": " Identify landmarks and places"
+    },
+    "main_endpoints": {
+        "visual_intelligence": "/visual/analyze",
+        "quick_scan": "/visual/quick-scan",
+        "smart_search": "/visual/smart-search",
+        "batch_analysis": "/batch/analyze-multiple",
+        "image_comparison": "/compare/compare",
+        "health": "/health"
+    }
+}
+
+_HEALTH_PAYLOAD = {
+    "status": "healthy",
+    "message": "🍎 AI Lens Visual Intelligence is running",
+    "version": settings.app_version,
+    "inspiration": "Apple Visual Intelligence",
+    "services": {
+        "visual_intelligence": " Comprehensive analysis system",
+        "caption": " BLIP image captioning",
+        "search": " Pixabay API integrated",
+        "batch": " Multi-image processing",
+        "comparison": " Image similarity analysis",
+        "llm": " Enhanced summaries"
+    },
+    "capabilities": [
+        "Object Recognition",
+        "Text Extraction & Translation", 
+        "Visual Shopping",
+        "Nature Identification",
+        "Food Analysis",
+        "Landmark Recognition",
+        "QR/Barcode Scanning",
+        "Smart Contextual Search"
+    ]
+}
+
+# Health checks are hit by probes constantly, so serve pre-encoded bytes
+_HEALTH = StaticJSON(_HEALTH_PAYLOAD)
+
 @app.get("/")
 def root():
-    return {
-        "message": " AI Lens - Visual Intelligence API",
-        "inspiration": "Apple Visual Intelligence",
-        "version": settings.app_version,
-        "docs": "/docs",
-        "features": {
-            "visual_intelligence": " Comprehensive image analysis like Apple's system",
-            "quick_scan": " Instant analysis for immediate results",
-            "smart_search": " Contextual search based on image content",
-            "batch_processing": " Analyze multiple images simultaneously", 
-            "image_comparison": " Compare and find duplicate images",
-            "shopping": " Find similar products to buy",
-            "text_recognition": " Extract and translate text",
-            "nature_id": " Identify plants and animals",
-            "food_analysis": " Analyze food and nutrition",
-            "landmark_recognition": " Identify landmarks and places"
-        },
-        "main_endpoints": {
-            "visual_intelligence": "/visual/analyze",
-            "quick_scan": "/visual/quick-scan",
-            "smart_search": "/visual/smart-search",
-            "batch_analysis": "/batch/analyze-multiple",
-            "image_comparison": "/compare/compare",
-            "health": "/health"
-        }
-    }
+    return _ROOT_PAYLOAD
 
 @app.get("/health")
-def health_check():
-    return {
-        "status": "healthy",
-        "message": "🍎 AI Lens Visual Intelligence is running",
-        "version": settings.app_version,
-        "inspiration": "Apple Visual Intelligence",
-        "services": {
-            "visual_intelligence": " Comprehensive analysis system",
-            "caption": " BLIP image captioning",
-            "search": " Pixabay API integrated",
-            "batch": " Multi-image processing",
-            "comparison": " Image similarity analysis",
-            "llm": " Enhanced summaries"
-        },
-        "capabilities": [
-            "Object Recognition",
-            "Text Extraction & Translation", 
-            "Visual Shopping",
-            "Nature Identification",
-            "Food Analysis",
-            "Landmark Recognition",
-            "QR/Barcode Scanning",
-            "Smart Contextual Search"
-        ]
-    }
\ No newline at end of file
+def health_check(request: Request):
+    return _HEALTH.respond(request)
@@ -1,14 +1,24 @@
+import asyncio
 import logging
 import time
-from typing import Callable
+from collections import OrderedDict
+from typing import Callable, Tuple
 from fastapi import Request, Response, HTTPException
-from fastapi.responses import JSONResponse
+from app.responses import AppJSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.types import ASGIApp
 import traceback
 
 logger = logging.getLogger(__name__)
 
+def request_time(request: Request) -> float:
+    """Monotonic timestamp for this request, read from the event loop once and shared via request.state"""
+    now = getattr(request.state, "now", None)
+    if now is None:
+        now = asyncio.get_running_loop().time()
+        request.state.now = now
+    return now
+
 class ErrorHandlingMiddleware(BaseHTTPMiddleware):
     def __init__(self, app: ASGIApp):
         super().__init__(app)
@@ -26,7 +36,7 @@ class ErrorHandlingMiddleware(BaseHTTPMiddleware):
             logger.error(traceback.format_exc())
             
             # Return a generic error response
-            return JSONResponse(
+            return AppJSONResponse(
                 status_code=500,
                 content={
                     "error": "Internal Server Error",
@@ -40,7 +50,8 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
         super().__init__(app)
 
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        start_time = time.time()
+        loop = asyncio.get_running_loop()
+        start_time = request_time(request)
         
         # Log request
         logger.info(f" {request.method} {request.url.path} - Start")
@@ -48,32 +59,34 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
         response = await call_next(request)
         
         # Log response
-        process_time = time.time() - start_time
+        process_time = loop.time() - start_time
         logger.info(f" {request.method} {request.url.path} - {response.status_code} - {process_time:.3f}s")
         
         return response
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp, requests_per_minute: int = 100):
+    def __init__(self, app: ASGIApp, requests_per_minute: int = 100, max_tracked_ips: int = 100_000):
         super().__init__(app)
         self.requests_per_minute = requests_per_minute
-        self.request_counts = {}
-        self.last_reset = time.time()
+        self.max_tracked_ips = max_tracked_ips
+        self.refill_rate = requests_per_minute / 60.0  # tokens per second
+        # client ip -> (tokens, last refill timestamp), least recently seen first
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
 
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Simple rate limiting by IP
+        # Token bucket rate limiting by IP
         client_ip = request.client.host if request.client else "unknown"
-        current_time = time.time()
+        now = request_time(request)
         
-        # Reset counts every minute
-        if current_time - self.last_reset > 60:
-            self.request_counts = {}
-            self.last_reset = current_time
+        # Refill lazily based on time since the client's last request
+        tokens, last_ts = self.buckets.get(client_ip, (float(self.requests_per_minute), now))
+        tokens = min(float(self.requests_per_minute), tokens + (now - last_ts) * self.refill_rate)
         
         # Check rate limit
-        current_count = self.request_counts.get(client_ip, 0)
-        if current_count >= self.requests_per_minute:
-            return JSONResponse(
+        if tokens < 1:
+            self.buckets[client_ip] = (tokens, now)
+            self.buckets.move_to_end(client_ip)
+            return AppJSONResponse(
                 status_code=429,
                 content={
                     "error": "Rate limit exceeded",
@@ -81,8 +94,13 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
                 }
             )
         
-        # Increment count
-        self.request_counts[client_ip] = current_count + 1
+        # Consume a token
+        self.buckets[client_ip] = (tokens - 1, now)
+        self.buckets.move_to_end(client_ip)
+        
+        # Drop the least recently seen clients once the table is full
+        while len(self.buckets) > self.max_tracked_ips:
+            self.buckets.popitem(last=False)
         
         response = await call_next(request)
-        return response
\ No newline at end of file
+        return response
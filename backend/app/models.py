@@ -14,6 +14,13 @@ class LLMStyle(str, Enum):
     CREATIVE = "creative"
     CONCISE = "concise"
 
+class ContextType(str, Enum):
+    FASHION = "fashion"
+    FOOD = "food"
+    NATURE = "nature"
+    TECHNOLOGY = "technology"
+    GENERAL = "general"
+
 class AnalysisType(str, Enum):
     QUICK = "quick"
     COMPREHENSIVE = "comprehensive"
@@ -275,6 +282,15 @@ class LLMSummaryRequest(BaseModel):
     max_length: Optional[int] = 150
     style: Optional[str] = "descriptive"
 
+class CaptionEnhanceRequest(BaseModel):
+    caption: str
+    max_length: int = 50
+
+class ContextualSummaryRequest(BaseModel):
+    caption: str
+    context_type: ContextType = ContextType.GENERAL
+    max_length: int = 150
+
 class LLMSummaryResponse(BaseModel):
     summary: str
     original_caption: str
@@ -0,0 +1,54 @@
+from typing import Any
+import json
+import logging
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from app.cache import hexdigest
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    orjson_available = True
+except ImportError:
+    logger.warning("orjson not available, falling back to stdlib JSON responses. Install with: pip install orjson")
+    orjson_available = False
+
+def encode_json(content: Any) -> bytes:
+    """Encode content as compact JSON bytes"""
+    if not orjson_available:
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return orjson.dumps(
+        content,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    )
+
+def decode_json(data: bytes) -> Any:
+    """Parse JSON bytes, e.g. an upstream API response body"""
+    if not orjson_available:
+        return json.loads(data)
+    return orjson.loads(data)
+
+class AppJSONResponse(JSONResponse):
+    """JSON response encoded with orjson, accepting NumPy values and non-string dict keys"""
+    
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+class StaticJSON:
+    """Pre-encoded JSON payload with a strong ETag, for endpoints whose body never changes"""
+    
+    def __init__(self, content: Any, max_age: int = 30):
+        self.body = encode_json(content)
+        self.etag = f'"{hexdigest(self.body)}"'
+        self.headers = {
+            "ETag": self.etag,
+            "Cache-Control": f"public, max-age={max_age}"
+        }
+    
+    def respond(self, request: Request) -> Response:
+        """Serve the cached bytes, or 304 when the client already has them"""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and self.etag in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=self.headers)
+        return Response(content=self.body, media_type="application/json", headers=self.headers)
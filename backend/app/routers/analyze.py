@@ -1,34 +1,38 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, Depends, HTTPException
 import time
 import logging
-from app.services.caption import generate_caption
+from app.services.caption import generate_caption_image
 from app.models import ImageAnalysisResponse, ErrorResponse
+from app.cache import new_digest
+from app.services import redis_cache
+from app.utils.uploads import validate_image_upload
+from app.utils.image_decode import ImageCtx
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 @router.post("/caption", response_model=ImageAnalysisResponse)
-async def analyze_image(file: UploadFile = File(...)):
+async def analyze_image(file: UploadFile = Depends(validate_image_upload)):
     """Generate caption for uploaded image"""
     start_time = time.time()
     
-    # Validate file type
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(
-            status_code=400,
-            detail="File must be an image (JPEG, PNG, etc.)"
-        )
-    
-    # Validate file size (10MB limit)
-    if file.size and file.size > 10 * 1024 * 1024:
-        raise HTTPException(
-            status_code=400,
-            detail="File size must be less than 10MB"
-        )
-    
     try:
-        caption = await generate_caption(file)
+        # Read once, hashing as we go; the same buffer feeds BLIP on a miss
+        digest = new_digest()
+        image = await ImageCtx.from_upload(file, digest=digest)
+        
+        # Identical uploads reuse the cached caption instead of re-running BLIP
+        image_hash = digest.hexdigest()
+        cached_caption = await redis_cache.get_caption(image_hash)
+        if cached_caption is not None:
+            return ImageAnalysisResponse(
+                caption=cached_caption,
+                processing_time=time.time() - start_time,
+                cached=True
+            )
+        
+        # Concurrent uploads of the same image share a single BLIP call
+        caption = await redis_cache.get_or_compute_caption(image_hash, lambda: generate_caption_image(image))
         processing_time = time.time() - start_time
         
         return ImageAnalysisResponse(
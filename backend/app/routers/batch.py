@@ -1,22 +1,32 @@
 """
 Batch processing router for handling multiple images at once
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from typing import List, Dict, Any
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Union, AsyncIterator, Tuple
 import asyncio
 import time
 import logging
-from app.services.caption import generate_caption
+from app.services.caption import generate_caption_bytes, generate_captions_batch
 from app.services.pixabay_search import search_by_image_description
 from app.models import ImageSearchResponse, ImageSearchResult
+from app.config import settings
+from app.cache import ComputationAbandoned, cache, hexdigest
+from app.services import redis_cache
+from app.utils.image_sniff import sniff_upload
+from app.responses import encode_json
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Bound concurrent BLIP inference across all batch requests
+caption_semaphore = asyncio.Semaphore(settings.max_concurrent_captions)
+
 @router.post("/analyze-multiple")
 async def analyze_multiple_images(
     files: List[UploadFile] = File(...),
-    max_files: int = 10
+    max_files: int = 10,
+    stream: bool = Query(False, description="Stream one NDJSON line per image as soon as it is ready")
 ):
     """Analyze multiple images simultaneously"""
     if len(files) > max_files:
@@ -28,11 +38,10 @@ async def analyze_multiple_images(
     start_time = time.time()
     results = []
     
-    # Process all files concurrently
-    tasks = []
+    valid_files = []
     for i, file in enumerate(files):
-        # Validate file
-        if not file.content_type.startswith("image/"):
+        # Validate file by its signature
+        if await sniff_upload(file) is None:
             results.append({
                 "index": i,
                 "filename": file.filename,
@@ -41,21 +50,22 @@ async def analyze_multiple_images(
             })
             continue
         
-        # Add to processing tasks
-        tasks.append(process_single_image(file, i))
+        valid_files.append((i, file))
     
-    # Wait for all tasks to complete
-    if tasks:
-        batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        for result in batch_results:
-            if isinstance(result, Exception):
-                results.append({
-                    "error": str(result),
-                    "success": False
-                })
-            else:
-                results.append(result)
+    if stream:
+        # Read uploads now; they are closed before the streamed body is produced
+        images = [await file.read() for _, file in valid_files]
+        return StreamingResponse(
+            stream_caption_results(results, valid_files, images, len(files), start_time),
+            media_type="application/x-ndjson"
+        )
+    
+    # Caption all valid files in a single batched model call
+    captions = await caption_files([file for _, file in valid_files])
+    results.extend(
+        process_single_image(file, i, caption)
+        for (i, file), caption in zip(valid_files, captions)
+    )
     
     processing_time = time.time() - start_time
     
@@ -67,11 +77,144 @@ async def analyze_multiple_images(
         "processing_time": processing_time
     }
 
-async def process_single_image(file: UploadFile, index: int) -> Dict[str, Any]:
-    """Process a single image and return results"""
+async def stream_caption_results(
+    results: List[Dict[str, Any]],
+    valid_files: List[Tuple[int, UploadFile]],
+    images: List[bytes],
+    total_files: int,
+    start_time: float
+) -> AsyncIterator[bytes]:
+    """Yield NDJSON result lines as captions complete, followed by a summary line"""
+    processed = 0
+    failed = len(results)
+    
+    # Files rejected during validation are reported first
+    for result in results:
+        yield encode_json(result) + b"\n"
+    
+    async for position, caption in iter_captions(images):
+        i, file = valid_files[position]
+        result = process_single_image(file, i, caption)
+        if result["success"]:
+            processed += 1
+        else:
+            failed += 1
+        yield encode_json(result) + b"\n"
+    
+    yield encode_json({
+        "total_files": total_files,
+        "processed": processed,
+        "failed": failed,
+        "processing_time": time.time() - start_time
+    }) + b"\n"
+
+async def caption_files(files: List[UploadFile]) -> List[Union[str, Exception]]:
+    """Caption files, serving repeats from the cache and batching unique misses
+    
+    Returns the caption, or the exception raised while captioning, for each file.
+    """
+    # Read each upload exactly once; hashing and decoding share these bytes
+    images = [await file.read() for file in files]
+    
+    captions: List[Union[str, Exception]] = [None] * len(images)
+    async for position, caption in iter_captions(images):
+        captions[position] = caption
+    
+    return captions
+
+async def iter_captions(images: List[bytes]) -> AsyncIterator[Tuple[int, Union[str, Exception]]]:
+    """Yield (position, caption) pairs as they become available, cache hits first"""
+    # Group cache misses by image hash so duplicate uploads are captioned once
+    positions: Dict[str, List[int]] = {}
+    for i, data in enumerate(images):
+        positions.setdefault(hexdigest(data), []).append(i)
+    
+    cached = await asyncio.gather(*(redis_cache.get_caption(image_hash) for image_hash in positions))
+    pending: Dict[str, List[int]] = {}
+    for (image_hash, indexes), caption in zip(positions.items(), cached):
+        if caption is None:
+            pending[image_hash] = indexes
+        else:
+            for i in indexes:
+                yield i, caption
+    
+    # Images already being captioned by another request are awaited, not recomputed
+    owned = {}
+    waiting = {}
+    for image_hash, indexes in pending.items():
+        key = redis_cache.caption_key(image_hash)
+        inflight = cache.get_inflight(key)
+        if inflight is None:
+            cache.start_inflight(key)
+            owned[image_hash] = indexes
+        else:
+            waiting[image_hash] = inflight
+    
+    if owned:
+        try:
+            fresh = await caption_images_data([images[indexes[0]] for indexes in owned.values()])
+        except Exception as e:
+            for image_hash in owned:
+                cache.finish_inflight(redis_cache.caption_key(image_hash), error=e)
+            raise
+        except BaseException:
+            # A disconnecting client must not cancel the requests waiting on its captions
+            for image_hash in owned:
+                cache.abandon_inflight(redis_cache.caption_key(image_hash))
+            raise
+        
+        # Publish every result before yielding, so waiters are released even if the consumer stops early
+        for image_hash, caption in zip(owned, fresh):
+            key = redis_cache.caption_key(image_hash)
+            if isinstance(caption, Exception):
+                cache.finish_inflight(key, error=caption)
+            else:
+                cache.finish_inflight(key, caption, ttl=settings.caption_cache_ttl)
+        await asyncio.gather(*(
+            redis_cache.set_caption(image_hash, caption)
+            for image_hash, caption in zip(owned, fresh)
+            if not isinstance(caption, Exception)
+        ))
+        
+        for indexes, caption in zip(owned.values(), fresh):
+            for i in indexes:
+                yield i, caption
+    
+    for image_hash, inflight in waiting.items():
+        try:
+            caption = await asyncio.shield(inflight)
+        except ComputationAbandoned:
+            # The producing request was cancelled; caption the image here instead
+            data = images[pending[image_hash][0]]
+            try:
+                caption = await redis_cache.get_or_compute_caption(image_hash, lambda: caption_image_data(data))
+            except Exception as e:
+                caption = e
+        except Exception as e:
+            caption = e
+        for i in pending[image_hash]:
+            yield i, caption
+
+async def caption_image_data(data: bytes) -> str:
+    """Caption one image's bytes"""
+    async with caption_semaphore:
+        return await generate_caption_bytes(data)
+
+async def caption_images_data(images: List[bytes]) -> List[Union[str, Exception]]:
+    """Caption image bytes in one batched model call, falling back to per-image calls"""
+    try:
+        async with caption_semaphore:
+            return await generate_captions_batch(images)
+    except Exception as e:
+        logger.warning(f"Batched captioning failed, captioning images individually: {e}")
+    
+    return await asyncio.gather(*(caption_image_data(data) for data in images), return_exceptions=True)
+
+def process_single_image(file: UploadFile, index: int, caption: Union[str, Exception]) -> Dict[str, Any]:
+    """Build the result entry for a single captioned image"""
     try:
-        # Generate caption
-        caption = await generate_caption(file)
+        if isinstance(caption, Exception):
+            raise caption
         
         return {
             "index": index,
@@ -104,47 +247,27 @@ async def search_multiple_images(
     start_time = time.time()
     results = []
     
+    valid_files = []
     for i, file in enumerate(files):
-        try:
-            if not file.content_type.startswith("image/"):
-                results.append({
-                    "index": i,
-                    "filename": file.filename,
-                    "error": "Invalid file type",
-                    "success": False
-                })
-                continue
-            
-            # Generate caption and search
-            caption = await generate_caption(file)
-            search_results = await search_by_image_description(caption, results_per_image)
-            
-            # Format results
-            similar_images = []
-            for result in search_results["results"]:
-                similar_images.append({
-                    "url": result["url"],
-                    "thumbnail": result["thumbnail"],
-                    "title": result["title"],
-                    "source": result["source"]
-                })
-            
+        if await sniff_upload(file) is None:
             results.append({
                 "index": i,
                 "filename": file.filename,
-                "caption": caption,
-                "similar_images": similar_images,
-                "success": True
-            })
-            
-        except Exception as e:
-            logger.error(f"Error searching for image {i}: {e}")
-            results.append({
-                "index": i,
-                "filename": file.filename,
-                "error": str(e),
+                "error": "Invalid file type",
                 "success": False
             })
+            continue
+        
+        valid_files.append((i, file))
+    
+    # Caption everything in one batch, then search for all captions concurrently
+    captions = await caption_files([file for _, file in valid_files])
+    tasks = []
+    async with asyncio.TaskGroup() as tg:
+        for (i, file), caption in zip(valid_files, captions):
+            tasks.append(tg.create_task(search_single_image(file, i, caption, results_per_image)))
+    
+    results.extend(task.result() for task in tasks)
     
     processing_time = time.time() - start_time
     
@@ -155,6 +278,46 @@ async def search_multiple_images(
         "processing_time": processing_time
     }
 
+async def search_single_image(
+    file: UploadFile,
+    index: int,
+    caption: Union[str, Exception],
+    results_per_image: int
+) -> Dict[str, Any]:
+    """Search for images similar to a single captioned image"""
+    try:
+        if isinstance(caption, Exception):
+            raise caption
+        
+        search_results = await search_by_image_description(caption, results_per_image)
+        
+        # Format results
+        similar_images = []
+        for result in search_results["results"]:
+            similar_images.append({
+                "url": result["url"],
+                "thumbnail": result["thumbnail"],
+                "title": result["title"],
+                "source": result["source"]
+            })
+        
+        return {
+            "index": index,
+            "filename": file.filename,
+            "caption": caption,
+            "similar_images": similar_images,
+            "success": True
+        }
+        
+    except Exception as e:
+        logger.error(f"Error searching for image {index}: {e}")
+        return {
+            "index": index,
+            "filename": file.filename,
+            "error": str(e),
+            "success": False
+        }
+
 @router.get("/health")
 def batch_health():
     """Check if batch processing service is healthy"""
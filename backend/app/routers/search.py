@@ -1,65 +1,65 @@
 # routers/search.py
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, Depends, HTTPException, Query, Request
+import asyncio
 import time
 import logging
-from typing import Optional
-from app.services.caption import generate_caption
-from app.services.pixabay_search import search_by_image_description, search_similar_images_pixabay
+from typing import List, Optional
+from pydantic import TypeAdapter
+from app.services.caption import generate_caption_bytes
+from app.services.pixabay_search import search_by_image_description, search_similar_images_pixabay, warm_connection
+from app.services.upstream import pixabay_limiter
 from app.models import ImageSearchResponse, ImageSearchResult, ErrorResponse
+from app.utils.uploads import read_upload, validate_image_upload, UploadTooLarge
+from app.config import settings
+from app.cache import new_digest
+from app.services import redis_cache
+from app.responses import StaticJSON
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Validates a whole Pixabay result list in one pydantic-core call
+RESULTS_ADAPTER = TypeAdapter(List[ImageSearchResult])
+
 @router.post("/by-image", response_model=ImageSearchResponse)
 async def search_by_image(
-    file: UploadFile = File(...),
+    file: UploadFile = Depends(validate_image_upload),
     count: int = Query(10, ge=1, le=50, description="Number of results to return")
 ):
     """Search for similar images on the internet using an uploaded image"""
-    start_time = time.time()
-    
-    # Validate file type
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(
-            status_code=400,
-            detail="File must be an image (JPEG, PNG, etc.)"
-        )
+    start_ns = time.perf_counter_ns()
     
-    # Validate file size (10MB limit)
-    if file.size and file.size > 10 * 1024 * 1024:
+    # Read the upload in chunks, stopping early past the size limit and hashing as we go
+    digest = new_digest()
+    try:
+        contents = await read_upload(file, settings.max_image_size, digest=digest)
+    except UploadTooLarge:
         raise HTTPException(
             status_code=400,
             detail="File size must be less than 10MB"
         )
     
     try:
-        # First, generate a caption for the uploaded image
-        logger.info("Generating caption for uploaded image...")
-        caption = await generate_caption(file)
+        # Repeat uploads of the same image skip the vision model entirely
+        image_hash = digest.hexdigest()
+        caption = await redis_cache.get_caption(image_hash)
+        
+        if caption is None:
+            # Generate a caption for the uploaded image, opening the Pixabay connection meanwhile
+            logger.info("Generating caption for uploaded image...")
+            caption, _ = await asyncio.gather(
+                redis_cache.get_or_compute_caption(image_hash, lambda: generate_caption_bytes(contents)),
+                warm_connection()
+            )
         
         # Use the caption to search for similar images on Pixabay
-        logger.info(f"Searching for similar images using caption: '{caption}'")
+        logger.info("Searching for similar images using caption: %r", caption)
         search_results = await search_by_image_description(caption, count)
         
-        # Convert results to the expected format
-        similar_images = []
-        for result in search_results["results"]:
-            similar_images.append(ImageSearchResult(
-                url=result["url"],
-                thumbnail=result["thumbnail"],
-                title=result["title"],
-                source=result["source"],
-                width=result["width"],
-                height=result["height"],
-                size=result["size"],
-                downloads=result.get("downloads"),
-                likes=result.get("likes"),
-                user=result.get("user"),
-                tags=result.get("tags", [])
-            ))
+        # Convert results to the expected format (result dict keys match the model fields)
+        similar_images = RESULTS_ADAPTER.validate_python(search_results["results"])
         
-        processing_time = time.time() - start_time
+        processing_time = (time.perf_counter_ns() - start_ns) / 1e9
         
         return ImageSearchResponse(
             caption=caption,
@@ -69,19 +69,26 @@ async def search_by_image(
         )
         
     except Exception as e:
-        logger.error(f"Error searching by image: {e}")
+        logger.error("Error searching by image: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to search images: {str(e)}"
         )
 
+_HEALTH = StaticJSON({
+    "status": "healthy", 
+    "service": "pixabay_image_search",
+    "features": ["image_to_caption_to_search"],
+    "api": "pixabay (free)",
+    "quota": "20,000 requests/month"
+})
+
 @router.get("/health")
-def search_health():
+def search_health(request: Request):
     """Check if search service is healthy"""
-    return {
-        "status": "healthy", 
-        "service": "pixabay_image_search",
-        "features": ["image_to_caption_to_search"],
-        "api": "pixabay (free)",
-        "quota": "20,000 requests/month"
-    }
+    return _HEALTH.respond(request)
+
+@router.get("/upstream")
+def search_upstream():
+    """Get Pixabay concurrency and retry statistics"""
+    return pixabay_limiter.get_stats()
@@ -1,17 +1,119 @@
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Query
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, NamedTuple, Optional, Any, Tuple, Union
+from functools import lru_cache
+import re
 import time
 import logging
 import asyncio
-from app.services.caption import generate_caption
+from app.services.caption import generate_caption_image
 from app.services.pixabay_search import search_similar_images_pixabay
-from app.cache import cache, cache_key_from_image
+from app.cache import cache, cache_key_from_hash, new_digest
+from app.utils.uploads import read_upload, UploadTooLarge
+from app.utils.image_decode import ImageCtx
+from app.responses import AppJSONResponse
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-@router.post("/analyze")
+# YOLO is optional: without it, object detection falls back to the image description
+try:
+    from app.services.detect import detect_objects_image
+    yolo_available = True
+except Exception as e:
+    logger.warning(f"YOLOv8 not available, using description-based detection: {e}")
+    detect_objects_image = None
+    yolo_available = False
+
+def keyword_pattern(keywords: List[str]) -> re.Pattern:
+    """Compile keywords into one alternation that matches wherever any of them appears as a substring"""
+    return re.compile("|".join(re.escape(keyword) for keyword in keywords))
+
+# BLIP captions repeat heavily across images, so the text helpers below memoize per description
+DESCRIPTION_CACHE_SIZE = 8192
+
+CATEGORY_KEYWORDS = {
+    "fashion": ["fashion", "style", "outfit", "clothing", "wear", "sweater", "hoodie", "pants", "trousers", "jeans", "shirt", "dress", "skirt", "jacket", "coat"],
+    "menswear": ["man", "male", "guy", "men's", "masculine", "gentleman"],
+    "womenswear": ["woman", "female", "lady", "women's", "feminine"],
+    "footwear": ["shoes", "sneakers", "boots", "sandals", "heels", "footwear"],
+    "accessories": ["watch", "bag", "jewelry", "hat", "sunglasses", "belt"],
+    "lifestyle": ["casual", "professional", "formal", "street", "urban", "minimal", "elegant"],
+    "people": ["person", "people", "portrait", "face", "individual"],
+    "animals": ["dog", "cat", "bird", "animal", "pet", "wildlife"],
+    "food": ["food", "dish", "meal", "restaurant", "cooking", "kitchen", "cuisine", "dining"],
+    "nature": ["tree", "flower", "plant", "garden", "landscape", "outdoor", "forest", "mountain"],
+    "technology": ["phone", "computer", "device", "electronic", "screen", "laptop", "smartphone"],
+    "transportation": ["car", "bike", "train", "bus", "vehicle", "motorcycle"],
+    "architecture": ["building", "house", "architecture", "structure", "interior", "room"],
+    "shopping": ["product", "item", "store", "brand", "commercial"],
+    "documents": ["text", "document", "paper", "book", "sign", "writing"],
+    "sports": ["sport", "fitness", "gym", "exercise", "athletic", "workout"],
+    "art": ["art", "painting", "creative", "design", "gallery", "artistic"]
+}
+
+# One pattern per category, so overlapping keywords ("man" inside "woman") still count for both
+CATEGORY_PATTERNS = {category: keyword_pattern(keywords) for category, keywords in CATEGORY_KEYWORDS.items()}
+
+SEARCH_TYPE_PATTERNS = (
+    ("food", keyword_pattern(["food", "dish", "meal", "restaurant", "cuisine"])),
+    ("nature", keyword_pattern(["plant", "flower", "tree", "nature", "garden"])),
+    ("landmarks", keyword_pattern(["building", "architecture", "landmark", "monument"])),
+    ("shopping", keyword_pattern(["clothing", "fashion", "wear", "outfit", "style", "man", "woman"])),
+    ("shopping", keyword_pattern(["product", "item", "device", "gadget", "tool"]))
+)
+
+LANDMARK_PATTERN = keyword_pattern(["building", "architecture", "monument", "landmark", "structure", "tower", "bridge"])
+FOOD_PATTERN = keyword_pattern(["food", "dish", "meal", "plate", "cooking", "restaurant", "cuisine"])
+
+# Triggers for generate_contextual_search_query, compiled once
+SWEATER_PATTERN = keyword_pattern(["sweater", "hoodie", "pullover", "jumper", "cardigan"])
+DARK_CASUAL_PATTERN = keyword_pattern(["black", "dark", "minimal", "casual"])
+PANTS_PATTERN = keyword_pattern(["pants", "trousers", "jeans", "chinos"])
+LIGHT_COLOR_PATTERN = keyword_pattern(["white", "cream", "beige"])
+MALE_PATTERN = keyword_pattern(["man", "male", "guy"])
+OUTFIT_PATTERN = keyword_pattern(["standing", "wearing", "outfit"])
+STYLE_INDICATOR_PATTERNS = (
+    ("minimalist", keyword_pattern(["minimal", "simple", "clean", "basic"])),
+    ("casual", keyword_pattern(["casual", "relaxed", "comfortable"])),
+    ("streetwear", keyword_pattern(["street", "urban", "modern"])),
+    ("formal", keyword_pattern(["professional", "business", "formal"]))
+)
+PHONE_PATTERN = keyword_pattern(["phone", "smartphone", "mobile"])
+PHONE_BRAND_PATTERN = keyword_pattern(["iphone", "apple", "samsung", "android"])
+PRODUCT_QUERY_RULES = (
+    (keyword_pattern(["laptop", "computer", "macbook"]), "modern laptop computer technology workspace"),
+    (keyword_pattern(["pizza", "burger", "sandwich"]), "delicious food cuisine restaurant dining"),
+    (keyword_pattern(["coffee", "latte", "cappuccino"]), "coffee cafe barista lifestyle")
+)
+FOOTWEAR_PATTERN = keyword_pattern(["shoes", "sneakers", "boots", "sandals"])
+FOOTWEAR_BRANDS = ("nike", "adidas", "converse", "vans")
+LIFESTYLE_QUERY_RULES = (
+    (keyword_pattern(["room", "interior", "furniture", "decor"]), "home decor interior design lifestyle"),
+    (keyword_pattern(["landscape", "mountain", "forest", "beach"]), "nature outdoor landscape photography travel"),
+    (keyword_pattern(["gym", "workout", "fitness", "exercise"]), "fitness workout health lifestyle sports"),
+    (keyword_pattern(["painting", "art", "gallery", "museum"]), "art culture creative design inspiration")
+)
+REMOVE_WORD_PATTERN = keyword_pattern(["'s", "women", "men", "2", "air", "zoom", "size", "color"])
+BRANDS = ("nike", "adidas", "apple", "samsung", "sony", "canon", "bmw", "mercedes")
+FASHION_ITEM_PATTERN = keyword_pattern(["shoe", "clothing", "wear"])
+
+class AnalyzeFlags(NamedTuple):
+    """Which analysis stages to run, and their settings"""
+    objects: bool = True
+    text: bool = True
+    shopping: bool = True
+    translation: bool = False
+    target_language: str = "en"
+    landmarks: bool = False
+    nature: bool = False
+    food: bool = False
+    codes: bool = False
+    confidence_threshold: float = 0.5
+
+QUICK_SCAN_FLAGS = AnalyzeFlags(shopping=False, confidence_threshold=0.7)
+
+@router.post("/analyze", response_class=AppJSONResponse)
 async def visual_intelligence_analyze(
     file: UploadFile = File(...),
     include_objects: bool = Query(True, description="Detect and identify objects"),
@@ -22,11 +124,32 @@ async def visual_intelligence_analyze(
     include_landmarks: bool = Query(False, description="Identify landmarks and places"),
     include_nature: bool = Query(False, description="Identify plants and animals"),
     include_food: bool = Query(False, description="Analyze food and nutrition"),
+    include_codes: bool = Query(False, description="Scan QR codes and barcodes"),
     confidence_threshold: float = Query(0.5, ge=0.1, le=1.0)
 ):
     """
     Apple Visual Intelligence style comprehensive image analysis
     """
+    return await analyze_upload(file, AnalyzeFlags(
+        objects=include_objects,
+        text=include_text,
+        shopping=include_shopping,
+        translation=include_translation,
+        target_language=target_language,
+        landmarks=include_landmarks,
+        nature=include_nature,
+        food=include_food,
+        codes=include_codes,
+        confidence_threshold=confidence_threshold
+    ))
+
+@router.post("/quick-scan", response_class=AppJSONResponse)
+async def quick_visual_scan(file: UploadFile = File(...)):
+    """Quick scan for immediate results - like Camera Control"""
+    return await analyze_upload(file, QUICK_SCAN_FLAGS)
+
+async def analyze_upload(file: UploadFile, flags: AnalyzeFlags) -> AppJSONResponse:
+    """Validate and read an upload, then serve its analysis from cache or run it"""
     start_time = time.time()
     
     # Validate file
@@ -36,7 +159,11 @@ async def visual_intelligence_analyze(
             detail="File must be an image"
         )
     
-    if file.size and file.size > 15 * 1024 * 1024:  # 15MB limit
+    # Read the upload once in chunks, hashing as we go; every stage below works on this buffer
+    digest = new_digest()
+    try:
+        image_bytes = await read_upload(file, 15 * 1024 * 1024, digest=digest)  # 15MB limit
+    except UploadTooLarge:
         raise HTTPException(
             status_code=400,
             detail="File size must be less than 15MB"
@@ -44,166 +171,161 @@ async def visual_intelligence_analyze(
     
     try:
         # Check cache first
-        cache_key = cache_key_from_image(await file.read(), {
-            "objects": include_objects,
-            "text": include_text,
-            "shopping": include_shopping
-        })
-        await file.seek(0)
+        cache_key = cache_key_from_hash(digest.hexdigest(), flags._asdict())
         
         cached_result = cache.get(cache_key)
         if cached_result:
             logger.info("Returning cached visual intelligence result")
-            return cached_result
-        
-        # Initialize results structure
-        results = {
-            "basic_info": {},
-            "objects": {},
-            "text": {},
-            "shopping": {},
-            "translation": {},
-            "landmarks": {},
-            "nature": {},
-            "food": {},
-            "codes": {}
-        }
-        
-        # Basic image description (always included)
-        logger.info(" Generating image description...")
-        description = await generate_caption(file)
-        results["basic_info"] = {
-            "description": description,
-            "confidence": 0.85,
-            "categories": await categorize_image_content(description)
-        }
-        
-        # Object detection and recognition
-        if include_objects:
-            logger.info(" Detecting objects...")
-            results["objects"] = await detect_and_identify_objects(file, confidence_threshold)
-        
-        # Text extraction and OCR
-        if include_text:
-            logger.info(" Extracting text...")
-            results["text"] = await extract_and_analyze_text(file)
-            
-            # Translation if requested
-            if include_translation and results["text"].get("extracted_text"):
-                logger.info(f" Translating to {target_language}...")
-                results["translation"] = await translate_text(
-                    results["text"]["extracted_text"], 
-                    target_language
-                )
-        
-        # Visual shopping - find similar products
-        if include_shopping:
-            logger.info(" Finding similar products...")
-            results["shopping"] = await find_similar_products(description)
-        
-        # Landmark recognition
-        if include_landmarks:
-            logger.info(" Identifying landmarks...")
-            results["landmarks"] = await identify_landmarks(file, description)
-        
-        # Nature identification (plants, animals)
-        if include_nature:
-            logger.info(" Identifying nature...")
-            results["nature"] = await identify_nature(file, description)
-        
-        # Food recognition and nutrition
-        if include_food:
-            logger.info(" Analyzing food...")
-            results["food"] = await analyze_food(file, description)
-        
-        # QR codes and barcodes
-        logger.info("📱 Scanning codes...")
-        results["codes"] = await scan_codes(file)
-        
-        processing_time = time.time() - start_time
-        
-        response = {
-            "analysis_results": results,
-            "meta": {
-                "processing_time": processing_time,
-                "image_info": {
-                    "filename": file.filename,
-                    "size": file.size,
-                    "content_type": file.content_type
-                },
-                "features_used": {
-                    "objects": include_objects,
-                    "text": include_text,
-                    "shopping": include_shopping,
-                    "translation": include_translation,
-                    "landmarks": include_landmarks,
-                    "nature": include_nature,
-                    "food": include_food
-                }
-            }
-        }
-        
-        # Cache the result
-        cache.set(cache_key, response, ttl=3600)  # 1 hour
-        
-        return response
-        
+            return AppJSONResponse(cached_result)
+        
+        # Identical requests already in flight share one analysis; the result is cached for 1 hour.
+        # Returning the response directly skips FastAPI's jsonable_encoder pass over the large payload.
+        return AppJSONResponse(await cache.get_or_compute(
+            cache_key,
+            lambda: run_analysis(image_bytes, file.filename, file.content_type, flags, start_time),
+            ttl=3600
+        ))
+        
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Visual intelligence analysis failed: {e}")
+        logger.exception("Visual intelligence analysis failed")
         raise HTTPException(
             status_code=500,
             detail=f"Analysis failed: {str(e)}"
         )
 
-@router.post("/quick-scan")
-async def quick_visual_scan(file: UploadFile = File(...)):
-    """Quick scan for immediate results - like Camera Control"""
-    return await visual_intelligence_analyze(
-        file=file,
-        include_objects=True,
-        include_text=True,
-        include_shopping=False,
-        include_translation=False,
-        include_landmarks=False,
-        include_nature=False,
-        include_food=False,
-        confidence_threshold=0.7
-    )
-
-@router.post("/smart-search")
+async def run_analysis(
+    image_bytes: Union[bytes, memoryview],
+    filename: Optional[str],
+    content_type: Optional[str],
+    flags: AnalyzeFlags,
+    start_time: float
+) -> Dict[str, Any]:
+    """Run the selected analysis stages on an image and build the response payload"""
+    # Initialize results structure
+    results = {
+        "basic_info": {},
+        "objects": {},
+        "text": {},
+        "shopping": {},
+        "translation": {},
+        "landmarks": {},
+        "nature": {},
+        "food": {},
+        "codes": {}
+    }
+    
+    # Decoded once here and shared by every stage that looks at pixels
+    image = ImageCtx(image_bytes)
+    
+    # Basic image description (always included)
+    logger.info(" Generating image description...")
+    description = await generate_caption_image(image)
+    results["basic_info"] = {
+        "description": description,
+        "confidence": 0.85,
+        "categories": list(categorize_image_content(description))
+    }
+    
+    # The remaining stages only depend on the description, so run them concurrently
+    stages = {}
+    if flags.objects:
+        stages["objects"] = detect_and_identify_objects(image, description, flags.confidence_threshold)
+    if flags.text:
+        stages["text"] = extract_and_analyze_text(image)
+    if flags.shopping:
+        stages["shopping"] = find_similar_products(description)
+    if flags.landmarks:
+        stages["landmarks"] = identify_landmarks(image, description)
+    if flags.nature:
+        stages["nature"] = identify_nature(image, description)
+    if flags.food:
+        stages["food"] = analyze_food(image, description)
+    if flags.codes:
+        stages["codes"] = scan_codes(image)
+    
+    logger.info(f" Running {len(stages)} analysis stages: {', '.join(stages)}")
+    outcomes = await asyncio.gather(*stages.values(), return_exceptions=True)
+    
+    # One failing stage shouldn't fail the whole analysis
+    for stage, outcome in zip(stages, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"Analysis stage '{stage}' failed: {outcome}")
+            results[stage] = {"error": str(outcome)}
+        else:
+            results[stage] = outcome
+    
+    # Translation needs the extracted text
+    if flags.text and flags.translation and results["text"].get("extracted_text"):
+        logger.info(f" Translating to {flags.target_language}...")
+        results["translation"] = await translate_text(
+            results["text"]["extracted_text"], 
+            flags.target_language
+        )
+    
+    processing_time = time.time() - start_time
+    
+    return {
+        "analysis_results": results,
+        "meta": {
+            "processing_time": processing_time,
+            "image_info": {
+                "filename": filename,
+                "size": len(image_bytes),
+                "content_type": content_type
+            },
+            "features_used": {
+                "objects": flags.objects,
+                "text": flags.text,
+                "shopping": flags.shopping,
+                "translation": flags.translation,
+                "landmarks": flags.landmarks,
+                "nature": flags.nature,
+                "food": flags.food,
+                "codes": flags.codes
+            }
+        }
+    }
+
+@router.post("/smart-search", response_class=AppJSONResponse)
 async def smart_visual_search(
     file: UploadFile = File(...),
     search_type: str = Query("general", description="Type: general, shopping, food, nature, landmarks")
 ):
     """Smart contextual search based on image content"""
+    try:
+        image_bytes = await read_upload(file, 15 * 1024 * 1024)  # 15MB limit
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=400,
+            detail="File size must be less than 15MB"
+        )
+    
     try:
         # Generate description
-        description = await generate_caption(file)
+        image = ImageCtx(image_bytes)
+        description = await generate_caption_image(image)
         
         # Generate contextual query for better results
-        contextual_query = await generate_contextual_search_query(description)
+        contextual_query = generate_contextual_search_query(description)
         
         # Determine search strategy based on content with better context understanding
-        if any(word in description.lower() for word in ["food", "dish", "meal", "restaurant", "cuisine"]):
-            search_type = "food"
-        elif any(word in description.lower() for word in ["plant", "flower", "tree", "nature", "garden"]):
-            search_type = "nature"
-        elif any(word in description.lower() for word in ["building", "architecture", "landmark", "monument"]):
-            search_type = "landmarks"
-        elif any(word in description.lower() for word in ["clothing", "fashion", "wear", "outfit", "style", "man", "woman"]):
-            search_type = "shopping"
-        elif any(word in description.lower() for word in ["product", "item", "device", "gadget", "tool"]):
-            search_type = "shopping"
+        desc_lower = description.lower()
+        for detected_type, pattern in SEARCH_TYPE_PATTERNS:
+            if pattern.search(desc_lower):
+                search_type = detected_type
+                break
         
         # Enhanced search based on type
         if search_type == "shopping":
-            results = await find_similar_products(description)
+            results = await find_similar_products(description, contextual_query)
         elif search_type == "food":
-            results = await analyze_food(file, description)
+            results = await analyze_food(image, description)
         elif search_type == "nature":
-            results = await identify_nature(file, description)
+            results = await identify_nature(image, description)
         elif search_type == "landmarks":
-            results = await identify_landmarks(file, description)
+            results = await identify_landmarks(image, description)
         else:
             # General search with contextual enhancement
             search_results = await search_similar_images_pixabay(contextual_query, count=8)
@@ -214,15 +336,17 @@ async def smart_visual_search(
                 "similar_images": search_results
             }
         
-        return {
+        return AppJSONResponse({
             "search_results": results,
             "detected_type": search_type,
             "original_description": description,
             "contextual_understanding": contextual_query
-        }
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Smart search failed: {e}")
+        logger.exception("Smart search failed")
         raise HTTPException(
             status_code=500,
             detail=f"Smart search failed: {str(e)}"
@@ -230,33 +354,17 @@ async def smart_visual_search(
 
 # Helper functions for different analysis types
 
-async def categorize_image_content(description: str) -> List[str]:
-    """Categorize image content like Apple's system with enhanced fashion understanding"""
+@lru_cache(maxsize=DESCRIPTION_CACHE_SIZE)
+def categorize_image_content(description: str) -> Tuple[str, ...]:
+    """Categorize image content like Apple's system with enhanced fashion understanding
+    
+    Cached per description (captions repeat across users), so it returns an immutable tuple.
+    """
     categories = []
     desc_lower = description.lower()
     
-    category_keywords = {
-        "fashion": ["fashion", "style", "outfit", "clothing", "wear", "sweater", "hoodie", "pants", "trousers", "jeans", "shirt", "dress", "skirt", "jacket", "coat"],
-        "menswear": ["man", "male", "guy", "men's", "masculine", "gentleman"],
-        "womenswear": ["woman", "female", "lady", "women's", "feminine"],
-        "footwear": ["shoes", "sneakers", "boots", "sandals", "heels", "footwear"],
-        "accessories": ["watch", "bag", "jewelry", "hat", "sunglasses", "belt"],
-        "lifestyle": ["casual", "professional", "formal", "street", "urban", "minimal", "elegant"],
-        "people": ["person", "people", "portrait", "face", "individual"],
-        "animals": ["dog", "cat", "bird", "animal", "pet", "wildlife"],
-        "food": ["food", "dish", "meal", "restaurant", "cooking", "kitchen", "cuisine", "dining"],
-        "nature": ["tree", "flower", "plant", "garden", "landscape", "outdoor", "forest", "mountain"],
-        "technology": ["phone", "computer", "device", "electronic", "screen", "laptop", "smartphone"],
-        "transportation": ["car", "bike", "train", "bus", "vehicle", "motorcycle"],
-        "architecture": ["building", "house", "architecture", "structure", "interior", "room"],
-        "shopping": ["product", "item", "store", "brand", "commercial"],
-        "documents": ["text", "document", "paper", "book", "sign", "writing"],
-        "sports": ["sport", "fitness", "gym", "exercise", "athletic", "workout"],
-        "art": ["art", "painting", "creative", "design", "gallery", "artistic"]
-    }
-    
-    for category, keywords in category_keywords.items():
-        if any(keyword in desc_lower for keyword in keywords):
+    for category, pattern in CATEGORY_PATTERNS.items():
+        if pattern.search(desc_lower):
             categories.append(category)
     
     # Special fashion context detection
@@ -268,18 +376,19 @@ async def categorize_image_content(description: str) -> List[str]:
     if "people" in categories and any(cat in categories for cat in ["fashion", "menswear", "womenswear"]):
         categories.append("lifestyle")
     
-    return categories if categories else ["general"]
+    return tuple(categories) if categories else ("general",)
 
-async def detect_and_identify_objects(file: UploadFile, confidence_threshold: float) -> Dict[str, Any]:
+async def detect_and_identify_objects(image: ImageCtx, description: str, confidence_threshold: float) -> Dict[str, Any]:
     """Enhanced object detection using real YOLOv8"""
     try:
-        # Try to use the real YOLO detector from detect.py
+        if not yolo_available:
+            return await detect_objects_from_description(description, confidence_threshold)
+        
         try:
-            from app.services.detect import detect_objects
             logger.info("Using YOLOv8 for object detection")
             
             # Get YOLO detections
-            detections = await detect_objects(file, confidence_threshold)
+            detections = await detect_objects_image(image, confidence_threshold)
             
             # Format for Visual Intelligence response
             objects = []
@@ -300,82 +409,92 @@ async def detect_and_identify_objects(file: UploadFile, confidence_threshold: fl
             }
             
         except Exception as yolo_error:
-            logger.warning(f"YOLOv8 not available, using description-based detection: {yolo_error}")
+            logger.warning(f"YOLOv8 detection failed, using description-based detection: {yolo_error}")
             # Fallback to description-based detection
-            return await detect_objects_from_description(file, confidence_threshold)
+            return await detect_objects_from_description(description, confidence_threshold)
             
     except Exception as e:
         logger.error(f"Object detection failed: {e}")
         return {"objects_found": 0, "objects": [], "error": str(e), "method": "failed"}
 
-async def detect_objects_from_description(file: UploadFile, confidence_threshold: float) -> Dict[str, Any]:
+# Fallback object detection: object name -> description keywords, checked in order
+COMMON_OBJECTS = {
+    # People
+    "person": ["person", "man", "woman", "child", "people", "individual"],
+    "face": ["face", "portrait", "head"],
+    
+    # Clothing & Fashion
+    "clothing": ["clothing", "shirt", "jacket", "dress", "pants", "sweater"],
+    "shoes": ["shoes", "sneakers", "boots", "footwear"],
+    "accessories": ["watch", "bag", "hat", "jewelry"],
+    
+    # Technology
+    "phone": ["phone", "smartphone", "mobile"],
+    "computer": ["computer", "laptop", "screen", "monitor"],
+    "device": ["device", "electronic", "gadget"],
+    
+    # Furniture & Objects
+    "chair": ["chair", "seat"],
+    "table": ["table", "desk"],
+    "book": ["book", "document", "paper"],
+    "bottle": ["bottle", "container"],
+    "cup": ["cup", "mug", "glass"],
+    
+    # Food
+    "food": ["food", "meal", "dish", "plate"],
+    
+    # Vehicles
+    "car": ["car", "vehicle", "automobile"],
+    "bike": ["bike", "bicycle", "motorcycle"],
+    
+    # Nature
+    "tree": ["tree", "plant", "vegetation"],
+    "flower": ["flower", "bloom", "blossom"],
+    
+    # Buildings
+    "building": ["building", "house", "structure", "architecture"],
+    "sign": ["sign", "text", "writing"]
+}
+
+@lru_cache(maxsize=DESCRIPTION_CACHE_SIZE)
+def match_common_objects(description: str) -> Tuple[Tuple[str, str, bool], ...]:
+    """Find (object, first matching keyword, whole-word match) for each object mentioned in a description"""
+    desc_lower = description.lower()
+    desc_words = set(desc_lower.split())
+    
+    matches = []
+    for obj_name, keywords in COMMON_OBJECTS.items():
+        for keyword in keywords:
+            if keyword in desc_words:
+                matches.append((obj_name, keyword, True))
+                break
+            if keyword in desc_lower:
+                matches.append((obj_name, keyword, False))
+                break
+    return tuple(matches)
+
+async def detect_objects_from_description(description: str, confidence_threshold: float) -> Dict[str, Any]:
     """Fallback object detection using image description"""
     try:
-        description = await generate_caption(file)
-        
-        # Enhanced object detection from description
-        common_objects = {
-            # People
-            "person": ["person", "man", "woman", "child", "people", "individual"],
-            "face": ["face", "portrait", "head"],
-            
-            # Clothing & Fashion
-            "clothing": ["clothing", "shirt", "jacket", "dress", "pants", "sweater"],
-            "shoes": ["shoes", "sneakers", "boots", "footwear"],
-            "accessories": ["watch", "bag", "hat", "jewelry"],
-            
-            # Technology
-            "phone": ["phone", "smartphone", "mobile"],
-            "computer": ["computer", "laptop", "screen", "monitor"],
-            "device": ["device", "electronic", "gadget"],
-            
-            # Furniture & Objects
-            "chair": ["chair", "seat"],
-            "table": ["table", "desk"],
-            "book": ["book", "document", "paper"],
-            "bottle": ["bottle", "container"],
-            "cup": ["cup", "mug", "glass"],
-            
-            # Food
-            "food": ["food", "meal", "dish", "plate"],
-            
-            # Vehicles
-            "car": ["car", "vehicle", "automobile"],
-            "bike": ["bike", "bicycle", "motorcycle"],
+        detected_objects = []
+        for obj_name, keyword, exact_word in match_common_objects(description):
+            # Calculate confidence based on how specific the match is
+            base_confidence = confidence_threshold + 0.1
+            if exact_word:  # Exact word match
+                base_confidence += 0.2
+            if keyword == obj_name:  # Exact object name
+                base_confidence += 0.1
             
-            # Nature
-            "tree": ["tree", "plant", "vegetation"],
-            "flower": ["flower", "bloom", "blossom"],
+            # Don't exceed 0.95 confidence
+            final_confidence = min(base_confidence, 0.95)
             
-            # Buildings
-            "building": ["building", "house", "structure", "architecture"],
-            "sign": ["sign", "text", "writing"]
-        }
-        
-        detected_objects = []
-        desc_words = description.lower().split()
-        
-        for obj_name, keywords in common_objects.items():
-            for keyword in keywords:
-                if keyword in description.lower():
-                    # Calculate confidence based on how specific the match is
-                    base_confidence = confidence_threshold + 0.1
-                    if keyword in desc_words:  # Exact word match
-                        base_confidence += 0.2
-                    if keyword == obj_name:  # Exact object name
-                        base_confidence += 0.1
-                    
-                    # Don't exceed 0.95 confidence
-                    final_confidence = min(base_confidence, 0.95)
-                    
-                    detected_objects.append({
-                        "name": obj_name,
-                        "confidence": final_confidence,
-                        "description": f"{obj_name.capitalize()} detected from image description",
-                        "category": categorize_object(obj_name),
-                        "detected_via": keyword
-                    })
-                    break  # Only add each object once
+            detected_objects.append({
+                "name": obj_name,
+                "confidence": final_confidence,
+                "description": f"{obj_name.capitalize()} detected from image description",
+                "category": categorize_object(obj_name),
+                "detected_via": keyword
+            })
         
         return {
             "objects_found": len(detected_objects),
@@ -387,33 +506,35 @@ async def detect_objects_from_description(file: UploadFile, confidence_threshold
         logger.error(f"Description-based object detection failed: {e}")
         return {"objects_found": 0, "objects": [], "error": str(e)}
 
+# Detected object name -> response category
+OBJECT_CATEGORIES = {
+    "person": "people",
+    "face": "people",
+    "clothing": "fashion",
+    "shoes": "fashion",
+    "accessories": "fashion",
+    "phone": "technology",
+    "computer": "technology",
+    "device": "technology",
+    "chair": "furniture",
+    "table": "furniture",
+    "book": "items",
+    "bottle": "items",
+    "cup": "items",
+    "food": "food",
+    "car": "transportation",
+    "bike": "transportation",
+    "tree": "nature",
+    "flower": "nature",
+    "building": "architecture",
+    "sign": "text"
+}
+
 def categorize_object(obj_name: str) -> str:
     """Categorize detected objects"""
-    categories = {
-        "person": "people",
-        "face": "people",
-        "clothing": "fashion",
-        "shoes": "fashion",
-        "accessories": "fashion",
-        "phone": "technology",
-        "computer": "technology",
-        "device": "technology",
-        "chair": "furniture",
-        "table": "furniture",
-        "book": "items",
-        "bottle": "items",
-        "cup": "items",
-        "food": "food",
-        "car": "transportation",
-        "bike": "transportation",
-        "tree": "nature",
-        "flower": "nature",
-        "building": "architecture",
-        "sign": "text"
-    }
-    return categories.get(obj_name, "object")
+    return OBJECT_CATEGORIES.get(obj_name, "object")
 
-async def extract_and_analyze_text(file: UploadFile) -> Dict[str, Any]:
+async def extract_and_analyze_text(image: ImageCtx) -> Dict[str, Any]:
     """Extract and analyze text from images"""
     try:
         # Placeholder for OCR implementation
@@ -445,31 +566,24 @@ async def translate_text(text: str, target_language: str) -> Dict[str, Any]:
     except Exception as e:
         return {"translated": False, "error": str(e)}
 
-async def generate_contextual_search_query(description: str) -> str:
+@lru_cache(maxsize=DESCRIPTION_CACHE_SIZE)
+def generate_contextual_search_query(description: str) -> str:
     """Generate contextual search queries that understand broader concepts"""
     desc_lower = description.lower()
     
     # Fashion & Clothing Context
-    if any(word in desc_lower for word in ["sweater", "hoodie", "pullover", "jumper", "cardigan"]):
-        if any(word in desc_lower for word in ["black", "dark", "minimal", "casual"]):
+    if SWEATER_PATTERN.search(desc_lower):
+        if DARK_CASUAL_PATTERN.search(desc_lower):
             return "minimalist casual menswear black sweater"
         return "casual sweater menswear fashion"
     
-    if any(word in desc_lower for word in ["pants", "trousers", "jeans", "chinos"]):
-        if "white" in desc_lower or "cream" in desc_lower or "beige" in desc_lower:
+    if PANTS_PATTERN.search(desc_lower):
+        if LIGHT_COLOR_PATTERN.search(desc_lower):
             return "casual white pants menswear minimalist"
         return "casual pants menswear fashion"
         
-    if any(word in desc_lower for word in ["man", "male", "guy"]) and any(word in desc_lower for word in ["standing", "wearing", "outfit"]):
-        style_indicators = []
-        if any(word in desc_lower for word in ["minimal", "simple", "clean", "basic"]):
-            style_indicators.append("minimalist")
-        if any(word in desc_lower for word in ["casual", "relaxed", "comfortable"]):
-            style_indicators.append("casual")
-        if any(word in desc_lower for word in ["street", "urban", "modern"]):
-            style_indicators.append("streetwear")
-        if any(word in desc_lower for word in ["professional", "business", "formal"]):
-            style_indicators.append("formal")
+    if MALE_PATTERN.search(desc_lower) and OUTFIT_PATTERN.search(desc_lower):
+        style_indicators = [style for style, pattern in STYLE_INDICATOR_PATTERNS if pattern.search(desc_lower)]
             
         base_query = "menswear fashion style"
         if style_indicators:
@@ -477,69 +591,49 @@ async def generate_contextual_search_query(description: str) -> str:
         return f"casual {base_query}"
     
     # Technology Context
-    if any(word in desc_lower for word in ["phone", "smartphone", "mobile"]):
-        if any(brand in desc_lower for brand in ["iphone", "apple", "samsung", "android"]):
+    if PHONE_PATTERN.search(desc_lower):
+        if PHONE_BRAND_PATTERN.search(desc_lower):
             return "modern smartphone technology mobile device"
         return "smartphone mobile phone technology"
     
-    if any(word in desc_lower for word in ["laptop", "computer", "macbook"]):
-        return "modern laptop computer technology workspace"
-    
-    # Food & Cuisine Context
-    if any(word in desc_lower for word in ["pizza", "burger", "sandwich"]):
-        return "delicious food cuisine restaurant dining"
-    
-    if any(word in desc_lower for word in ["coffee", "latte", "cappuccino"]):
-        return "coffee cafe barista lifestyle"
+    # Computers, food & drink
+    for pattern, query in PRODUCT_QUERY_RULES:
+        if pattern.search(desc_lower):
+            return query
     
     # Footwear Context
-    if any(word in desc_lower for word in ["shoes", "sneakers", "boots", "sandals"]):
-        if any(brand in desc_lower for brand in ["nike", "adidas", "converse", "vans"]):
-            brand_found = next(brand for brand in ["nike", "adidas", "converse", "vans"] if brand in desc_lower)
+    if FOOTWEAR_PATTERN.search(desc_lower):
+        brand_found = next((brand for brand in FOOTWEAR_BRANDS if brand in desc_lower), None)
+        if brand_found:
             return f"{brand_found} footwear sneakers style fashion"
         return "footwear shoes fashion style"
     
-    # Home & Lifestyle Context
-    if any(word in desc_lower for word in ["room", "interior", "furniture", "decor"]):
-        return "home decor interior design lifestyle"
-    
-    # Nature & Outdoor Context
-    if any(word in desc_lower for word in ["landscape", "mountain", "forest", "beach"]):
-        return "nature outdoor landscape photography travel"
-    
-    # Sports & Fitness Context
-    if any(word in desc_lower for word in ["gym", "workout", "fitness", "exercise"]):
-        return "fitness workout health lifestyle sports"
-    
-    # Art & Culture Context
-    if any(word in desc_lower for word in ["painting", "art", "gallery", "museum"]):
-        return "art culture creative design inspiration"
+    # Home, nature, fitness and art
+    for pattern, query in LIFESTYLE_QUERY_RULES:
+        if pattern.search(desc_lower):
+            return query
     
     # Default contextual enhancement
     # Remove very specific details and focus on broader concepts
-    words_to_remove = ["'s", "women", "men", "2", "air", "zoom", "size", "color"]
-    filtered_words = []
-    for word in desc_lower.split():
-        if not any(remove_word in word for remove_word in words_to_remove):
-            filtered_words.append(word)
+    filtered_words = [word for word in desc_lower.split() if not REMOVE_WORD_PATTERN.search(word)]
     
     # If we have brand names, keep them but make query more general
-    brands = ["nike", "adidas", "apple", "samsung", "sony", "canon", "bmw", "mercedes"]
-    found_brand = next((brand for brand in brands if brand in desc_lower), None)
+    found_brand = next((brand for brand in BRANDS if brand in desc_lower), None)
     
     if found_brand:
-        category = "fashion" if any(word in desc_lower for word in ["shoe", "clothing", "wear"]) else "product"
+        category = "fashion" if FASHION_ITEM_PATTERN.search(desc_lower) else "product"
         return f"{found_brand} {category} style lifestyle"
     
     # Fallback: use first few meaningful words
     meaningful_words = [word for word in filtered_words if len(word) > 3][:3]
     return " ".join(meaningful_words) if meaningful_words else description
 
-async def find_similar_products(description: str) -> Dict[str, Any]:
+async def find_similar_products(description: str, contextual_query: Optional[str] = None) -> Dict[str, Any]:
     """Find similar products for shopping with contextual understanding"""
     try:
-        # Enhanced contextual search queries
-        contextual_query = await generate_contextual_search_query(description)
+        # Enhanced contextual search queries, unless the caller already built one
+        if contextual_query is None:
+            contextual_query = generate_contextual_search_query(description)
         
         # Use the contextual query for better results
         results = await search_similar_images_pixabay(contextual_query, count=6)
@@ -563,12 +657,10 @@ async def find_similar_products(description: str) -> Dict[str, Any]:
     except Exception as e:
         return {"products_found": 0, "error": str(e)}
 
-async def identify_landmarks(file: UploadFile, description: str) -> Dict[str, Any]:
+async def identify_landmarks(image: ImageCtx, description: str) -> Dict[str, Any]:
     """Identify landmarks and places"""
     try:
-        landmark_keywords = ["building", "architecture", "monument", "landmark", "structure", "tower", "bridge"]
-        
-        if any(keyword in description.lower() for keyword in landmark_keywords):
+        if LANDMARK_PATTERN.search(description.lower()):
             return {
                 "landmark_detected": True,
                 "possible_landmarks": [
@@ -590,18 +682,18 @@ async def identify_landmarks(file: UploadFile, description: str) -> Dict[str, An
     except Exception as e:
         return {"landmark_detected": False, "error": str(e)}
 
-async def identify_nature(file: UploadFile, description: str) -> Dict[str, Any]:
+NATURE_KEYWORDS = {
+    "plants": ["flower", "tree", "plant", "leaf", "garden", "botanical"],
+    "animals": ["dog", "cat", "bird", "animal", "wildlife", "pet"]
+}
+
+async def identify_nature(image: ImageCtx, description: str) -> Dict[str, Any]:
     """Identify plants and animals"""
     try:
-        nature_keywords = {
-            "plants": ["flower", "tree", "plant", "leaf", "garden", "botanical"],
-            "animals": ["dog", "cat", "bird", "animal", "wildlife", "pet"]
-        }
-        
         identified = []
         desc_lower = description.lower()
         
-        for category, keywords in nature_keywords.items():
+        for category, keywords in NATURE_KEYWORDS.items():
             for keyword in keywords:
                 if keyword in desc_lower:
                     identified.append({
@@ -622,12 +714,10 @@ async def identify_nature(file: UploadFile, description: str) -> Dict[str, Any]:
     except Exception as e:
         return {"nature_found": False, "error": str(e)}
 
-async def analyze_food(file: UploadFile, description: str) -> Dict[str, Any]:
+async def analyze_food(image: ImageCtx, description: str) -> Dict[str, Any]:
     """Analyze food and provide nutrition info"""
     try:
-        food_keywords = ["food", "dish", "meal", "plate", "cooking", "restaurant", "cuisine"]
-        
-        if any(keyword in description.lower() for keyword in food_keywords):
+        if FOOD_PATTERN.search(description.lower()):
             return {
                 "food_detected": True,
                 "dish_info": {
@@ -657,7 +747,7 @@ async def analyze_food(file: UploadFile, description: str) -> Dict[str, Any]:
     except Exception as e:
         return {"food_detected": False, "error": str(e)}
 
-async def scan_codes(file: UploadFile) -> Dict[str, Any]:
+async def scan_codes(image: ImageCtx) -> Dict[str, Any]:
     """Scan QR codes and barcodes"""
     try:
         # Placeholder for code scanning
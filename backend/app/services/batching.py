@@ -0,0 +1,64 @@
+"""
+Micro-batching: collect concurrent requests for a few milliseconds and resolve them with one call
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher(ABC):
+    """Queue requests and hand them to run_batch in groups of up to max_batch, waiting at most max_delay seconds"""
+    
+    def __init__(self, max_batch: int, max_delay: float):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.running: Set[asyncio.Task] = set()
+    
+    async def submit(self, *args: Any) -> Any:
+        """Queue a request and wait for its result"""
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self.drain())
+        
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((*args, future))
+        return await future
+    
+    async def drain(self):
+        """Collect requests for up to max_delay seconds, then dispatch them as one batch"""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            task = asyncio.create_task(self.dispatch(batch))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+    
+    async def dispatch(self, items: List[Tuple]):
+        """Run one batch, failing every waiting request if it raises"""
+        try:
+            await self.run_batch(items)
+        except Exception as e:
+            logger.error(f"{type(self).__name__} batch of {len(items)} failed: {e}")
+            for item in items:
+                if not item[-1].done():
+                    item[-1].set_exception(e)
+    
+    @abstractmethod
+    async def run_batch(self, items: List[Tuple]):
+        """Resolve the futures (last element of each item) for one batch"""
@@ -1,9 +1,17 @@
 import os
+import asyncio
+import multiprocessing
+import torch
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple, Union
 from PIL import Image
 from transformers import BlipProcessor, BlipForConditionalGeneration
 from dotenv import load_dotenv
-import io
 import logging
+from app.config import settings
+from app.utils.image_decode import load_image, ImageCtx
+from app.services.batching import MicroBatcher
+from app.utils.torch_threads import configure_cpu_threads
 
 load_dotenv()
 
@@ -16,10 +24,25 @@ HF_TOKEN = os.getenv("HUGGINGFACE_TOKEN")
 # Global variables for model and processor
 processor = None
 model = None
+device = "cpu"
+model_dtype = torch.float32
+
+# Serializes model calls so concurrent requests don't contend for the GPU
+model_lock = asyncio.Lock()
+
+# Dynamic batching: captions requested within BATCH_MAX_DELAY seconds share one generate() call
+BATCH_MAX_SIZE = settings.caption_batch_max_size
+BATCH_MAX_DELAY = settings.caption_batch_max_delay_ms / 1000
+
+# Optional process pool for image decoding (PREPROCESS_WORKERS > 0)
+preprocess_pool: Optional[ProcessPoolExecutor] = None
+
+# Optional process pool that holds its own BLIP copy per worker (CAPTION_WORKERS > 0)
+caption_pool: Optional[ProcessPoolExecutor] = None
 
 def load_models():
     """Load BLIP models once at startup"""
-    global processor, model
+    global processor, model, device, model_dtype
     try:
         logger.info("Loading BLIP models...")
         processor = BlipProcessor.from_pretrained(
@@ -30,37 +53,163 @@ def load_models():
             "Salesforce/blip-image-captioning-base",
             token=HF_TOKEN  # Updated from use_auth_token
         )
-        logger.info("BLIP models loaded successfully")
+        
+        if torch.cuda.is_available():
+            # Half precision runs on tensor cores; prefer bf16 where supported (Ampere+)
+            device = "cuda"
+            model_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            model = model.to(device=device, dtype=model_dtype)
+            
+            if settings.torch_compile:
+                # Images are always 384x384 but batches hold 1..CAPTION_BATCH_MAX_SIZE of them, so mark
+                # shapes dynamic rather than recompiling per batch size. Default mode: no CUDA graphs,
+                # which would be re-recorded per size and replayed from to_thread worker threads.
+                model.vision_model = torch.compile(model.vision_model, dynamic=True)
+        elif settings.caption_int8:
+            # INT8 weights for the Linear layers, activations quantized on the fly (uses VNNI/AMX where present)
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            logger.info("Quantized BLIP Linear layers to INT8")
+        
+        model.eval()
+        if device == "cuda":
+            # Hand the one-off loading peak back to the allocator pool
+            torch.cuda.empty_cache()
+        logger.info(f"BLIP models loaded successfully on {device} ({model_dtype})")
     except Exception as e:
         logger.error(f"Failed to load BLIP models: {e}")
         raise
 
-# Load models at module import
-try:
-    load_models()
-except Exception as e:
-    logger.warning(f"Could not load models at startup: {e}")
+# Load models at module import, unless captioning runs in worker processes that load their own
+if settings.caption_workers == 0:
+    try:
+        load_models()
+    except Exception as e:
+        logger.warning(f"Could not load models at startup: {e}")
 
-async def generate_caption(file):
-    """Generate caption for uploaded image"""
-    global processor, model
-    
+def ensure_models_loaded():
+    """Load BLIP models on first use if startup loading failed"""
     if processor is None or model is None:
         try:
             load_models()
         except Exception as e:
             logger.error(f"Failed to load models: {e}")
             raise Exception("Image captioning models not available")
+
+def get_preprocess_pool() -> Optional[ProcessPoolExecutor]:
+    """Get the shared decode process pool, or None when decoding runs in threads"""
+    global preprocess_pool
+    
+    if preprocess_pool is None and settings.preprocess_workers > 0:
+        # Spawn rather than fork so workers don't inherit torch/CUDA state
+        preprocess_pool = ProcessPoolExecutor(
+            max_workers=settings.preprocess_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"Started image decode pool with {settings.preprocess_workers} workers")
+    
+    return preprocess_pool
+
+def shutdown_preprocess_pool():
+    """Stop the decode process pool if it was started"""
+    global preprocess_pool
     
+    if preprocess_pool is not None:
+        preprocess_pool.shutdown(cancel_futures=True)
+        preprocess_pool = None
+
+def init_caption_worker():
+    """Captioning worker setup: take a fair share of the CPU threads, then load BLIP"""
+    configure_cpu_threads(share=settings.caption_workers)
+    ensure_models_loaded()
+
+def get_caption_pool() -> Optional[ProcessPoolExecutor]:
+    """Get the shared captioning process pool, or None when captioning runs in this process"""
+    global caption_pool
+    
+    if caption_pool is None and settings.caption_workers > 0:
+        # Each worker loads BLIP once in its initializer and keeps it for its lifetime
+        caption_pool = ProcessPoolExecutor(
+            max_workers=settings.caption_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_caption_worker
+        )
+        logger.info(f"Started captioning pool with {settings.caption_workers} workers")
+    
+    return caption_pool
+
+def shutdown_caption_pool():
+    """Stop the captioning process pool if it was started"""
+    global caption_pool
+    
+    if caption_pool is not None:
+        caption_pool.shutdown(cancel_futures=True)
+        caption_pool = None
+
+def caption_contents(contents: List[bytes]) -> List[str]:
+    """Decode and caption raw image data inside a captioning worker"""
+    return caption_images([load_image(data) for data in contents])
+
+async def decode_image(contents: Union[bytes, memoryview]) -> Image.Image:
+    """Decode an image off the event loop, in the process pool when enabled"""
+    return await ImageCtx(contents).pil(get_preprocess_pool())
+
+def caption_images(images: List[Image.Image]) -> List[str]:
+    """Caption a list of images with a single BLIP forward pass"""
+    inputs = processor(images=images, return_tensors="pt").to(device, model_dtype)
+    with torch.inference_mode():
+        output = model.generate(**inputs, max_length=50, num_beams=settings.caption_num_beams)
+    return processor.batch_decode(output, skip_special_tokens=True)
+
+async def run_captioning(images: List[Image.Image]) -> List[str]:
+    """Run BLIP in a worker thread, one call at a time, keeping the event loop free"""
+    async with model_lock:
+        return await asyncio.to_thread(caption_images, images)
+
+class CaptionBatcher(MicroBatcher):
+    """Coalesce concurrent single-image caption requests into one BLIP forward pass"""
+    
+    def __init__(self, max_batch: int = BATCH_MAX_SIZE, max_delay: float = BATCH_MAX_DELAY):
+        super().__init__(max_batch, max_delay)
+    
+    async def run_batch(self, items: List[Tuple]):
+        """Caption every queued image at once and fan the captions out"""
+        captions = await run_captioning([image for image, _ in items])
+        for (_, future), caption in zip(items, captions):
+            if not future.done():
+                future.set_result(caption)
+
+caption_batcher = CaptionBatcher()
+
+async def generate_caption(file):
+    """Generate caption for uploaded image"""
     try:
         # Read image data
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
-        
-        # Generate caption
-        inputs = processor(image, return_tensors="pt")
-        output = model.generate(**inputs, max_length=50, num_beams=5)
-        caption = processor.decode(output[0], skip_special_tokens=True)
+        return await generate_caption_bytes(contents)
+    finally:
+        # Reset file pointer for potential reuse
+        await file.seek(0)
+
+async def generate_caption_bytes(contents: Union[bytes, memoryview]) -> str:
+    """Generate caption for image data that has already been read"""
+    return await generate_caption_image(ImageCtx(contents))
+
+async def generate_caption_image(image: ImageCtx) -> str:
+    """Generate caption for an upload, reusing its decoded image if another stage already made one"""
+    pool = get_caption_pool()
+    if pool is None:
+        ensure_models_loaded()
+    
+    try:
+        if pool is not None:
+            # Decode and caption in a worker process, outside this process's GIL
+            caption = (await asyncio.get_running_loop().run_in_executor(pool, caption_contents, [bytes(image.raw)]))[0]
+        else:
+            # Decode off the event loop
+            pil_image = await image.pil(get_preprocess_pool())
+            
+            # Generate caption, sharing the forward pass with concurrent requests
+            caption = await caption_batcher.submit(pil_image)
         
         logger.info(f"Generated caption: {caption}")
         return caption
@@ -68,6 +217,27 @@ async def generate_caption(file):
     except Exception as e:
         logger.error(f"Error generating caption: {e}")
         raise Exception(f"Failed to generate caption: {str(e)}")
-    finally:
-        # Reset file pointer for potential reuse
-        await file.seek(0)
+
+async def generate_captions_batch(contents: List[Union[bytes, memoryview]]) -> List[str]:
+    """Generate captions for several already-read images in one model call"""
+    pool = get_caption_pool()
+    if pool is None:
+        ensure_models_loaded()
+    
+    try:
+        if pool is not None:
+            captions = await asyncio.get_running_loop().run_in_executor(
+                pool, caption_contents, [bytes(data) for data in contents]
+            )
+        else:
+            # Decode all images concurrently off the event loop
+            images = await asyncio.gather(*(decode_image(data) for data in contents))
+            
+            captions = await run_captioning(list(images))
+        
+        logger.info(f"Generated {len(captions)} captions in one batch")
+        return captions
+        
+    except Exception as e:
+        logger.error(f"Error generating batch captions: {e}")
+        raise Exception(f"Failed to generate captions: {str(e)}")
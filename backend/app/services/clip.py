@@ -3,8 +3,11 @@ import torch
 import numpy as np
 from typing import List, Union
 import logging
-from PIL import Image
-import io
+from functools import lru_cache
+from app.config import settings
+from app.cache import hexdigest
+from app.utils.image_decode import ImageCtx
+from app.services import redis_cache
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +17,9 @@ preprocess = None
 device = None
 clip_available = False
 
+CLIP_MODEL = "ViT-B/32"
+TEXT_EMBEDDING_CACHE_SIZE = 10_000  # float32 rows, ~2 KB each
+
 try:
     import clip
     clip_available = True
@@ -38,7 +44,24 @@ def load_clip_model():
         device = "cuda" if torch.cuda.is_available() else "cpu"
         logger.info(f"Loading CLIP model on device: {device}")
         
-        model, preprocess = clip.load("ViT-B/32", device=device)
+        # clip.load already returns fp16 weights on CUDA; on CPU the model is fp32
+        model, preprocess = clip.load(CLIP_MODEL, device=device)
+        
+        if device == "cuda" and settings.torch_compile:
+            # The image tower sees fixed 224x224 inputs, so it compiles without recompiles
+            model.visual = torch.compile(model.visual, mode="reduce-overhead")
+        
+        if device == "cpu" and settings.clip_int8:
+            try:
+                # INT8 weights for the transformer MLPs and projections, activations quantized on the fly
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                logger.info("Quantized CLIP Linear layers to INT8")
+            except Exception as e:
+                logger.warning(f"CLIP INT8 quantization failed, keeping FP32: {e}")
+        
+        if device == "cuda":
+            # Hand the one-off loading peak back to the allocator pool
+            torch.cuda.empty_cache()
         logger.info("CLIP model loaded successfully")
     except Exception as e:
         logger.error(f"Failed to load CLIP model: {e}")
@@ -53,6 +76,15 @@ if clip_available:
 
 async def get_image_embedding(file):
     """Generate CLIP embedding for uploaded image"""
+    try:
+        contents = await file.read()
+        return await get_image_embedding_image(ImageCtx(contents))
+    finally:
+        # Reset file pointer
+        await file.seek(0)
+
+async def get_image_embedding_image(image: ImageCtx):
+    """Generate CLIP embedding for an upload, reusing its decoded image if another stage already made one"""
     global model, preprocess, device
     
     if not clip_available:
@@ -66,13 +98,17 @@ async def get_image_embedding(file):
             raise Exception("CLIP model not available")
     
     try:
-        # Read and preprocess image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
-        image_input = preprocess(image).unsqueeze(0).to(device)
+        # Identical images skip the forward pass; the key covers the model variant that produced the embedding
+        cache_key = redis_cache.make_key("clip-image", CLIP_MODEL, settings.clip_int8, hexdigest(image.raw))
+        cached = await redis_cache.get_json(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Preprocess image
+        image_input = preprocess(await image.pil()).unsqueeze(0).to(device)
         
         # Generate embedding
-        with torch.no_grad():
+        with torch.inference_mode():
             image_features = model.encode_image(image_input)
             image_features = image_features / image_features.norm(dim=-1, keepdim=True)
         
@@ -80,14 +116,13 @@ async def get_image_embedding(file):
         embedding = image_features.cpu().numpy().flatten()
         
         logger.info(f"Generated image embedding with shape: {embedding.shape}")
-        return embedding.tolist()
+        embedding = embedding.tolist()
+        await redis_cache.set_json(cache_key, embedding, settings.embedding_cache_ttl)
+        return embedding
         
     except Exception as e:
         logger.error(f"Error generating image embedding: {e}")
         raise Exception(f"Failed to generate image embedding: {str(e)}")
-    finally:
-        # Reset file pointer
-        await file.seek(0)
 
 def get_text_embedding(text: str):
     """Generate CLIP embedding for text"""
@@ -104,15 +139,7 @@ def get_text_embedding(text: str):
             raise Exception("CLIP model not available")
     
     try:
-        # Tokenize and encode text
-        text_input = clip.tokenize([text]).to(device)
-        
-        with torch.no_grad():
-            text_features = model.encode_text(text_input)
-            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-        
-        # Convert to numpy array
-        embedding = text_features.cpu().numpy().flatten()
+        embedding = encode_text(text)
         
         logger.info(f"Generated text embedding with shape: {embedding.shape}")
         return embedding.tolist()
@@ -121,15 +148,58 @@ def get_text_embedding(text: str):
         logger.error(f"Error generating text embedding: {e}")
         raise Exception(f"Failed to generate text embedding: {str(e)}")
 
-def calculate_similarity(embedding1: List[float], embedding2: List[float]) -> float:
-    """Calculate cosine similarity between two embeddings"""
+def get_text_embeddings(texts: List[str]) -> List[List[float]]:
+    """Generate CLIP embeddings for several texts with one tokenize and one encoder pass"""
+    global model, device
+    
+    if not clip_available:
+        raise Exception("CLIP library not available. Install with: pip install git+https://github.com/openai/CLIP.git")
+    
+    if model is None:
+        try:
+            load_clip_model()
+        except Exception as e:
+            logger.error(f"Failed to load CLIP model: {e}")
+            raise Exception("CLIP model not available")
+    
+    if not texts:
+        return []
+    
     try:
-        # Convert to numpy arrays
-        emb1 = np.array(embedding1)
-        emb2 = np.array(embedding2)
+        embeddings = encode_texts(texts)
         
-        # Calculate cosine similarity
-        similarity = np.dot(emb1, emb2) / (np.linalg.norm(emb1) * np.linalg.norm(emb2))
+        logger.info(f"Generated {len(texts)} text embeddings with shape: {embeddings.shape}")
+        return embeddings.tolist()
+        
+    except Exception as e:
+        logger.error(f"Error generating text embeddings: {e}")
+        raise Exception(f"Failed to generate text embeddings: {str(e)}")
+
+def encode_texts(texts: List[str]) -> np.ndarray:
+    """Encode a batch of texts with CLIP into normalized (K, D) float32 rows"""
+    # Tokenize and encode text as one (K, 77) batch
+    text_input = clip.tokenize(texts).to(device)
+    
+    with torch.inference_mode():
+        text_features = model.encode_text(text_input)
+        text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+    
+    return text_features.float().cpu().numpy()
+
+@lru_cache(maxsize=TEXT_EMBEDDING_CACHE_SIZE)
+def encode_text(text: str) -> np.ndarray:
+    """Encode text with CLIP; search queries repeat, so results are memoized"""
+    embedding = encode_texts([text])[0]
+    
+    # Read-only since the cache hands out the same array every time
+    embedding.setflags(write=False)
+    return embedding
+
+def calculate_similarity(embedding1: List[float], embedding2: List[float]) -> float:
+    """Calculate cosine similarity between two CLIP embeddings (both already unit-norm)"""
+    try:
+        # Embeddings leave this module normalized, so cosine similarity is the dot product
+        similarity = np.dot(np.asarray(embedding1, dtype=np.float32), np.asarray(embedding2, dtype=np.float32))
         
         return float(similarity)
     except Exception as e:
@@ -0,0 +1,43 @@
+"""
+Shared pooled HTTP client for upstream APIs
+"""
+import logging
+from typing import Optional
+import httpx
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    http2_available = True
+except ImportError:
+    logger.info("h2 not available, upstream calls use HTTP/1.1. Install with: pip install httpx[http2]")
+    http2_available = False
+
+# Global client (created on first use, closed at shutdown)
+http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the shared HTTP client, reusing pooled TLS connections across requests"""
+    global http_client
+    
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            http2=http2_available,
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive
+            ),
+            timeout=10.0
+        )
+    
+    return http_client
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client"""
+    global http_client
+    
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
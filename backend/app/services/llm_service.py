@@ -1,10 +1,14 @@
 # services/llm_service.py
 import os
 import logging
-from typing import Optional
+from typing import Dict, List, Tuple
 import asyncio
-import requests
 from dotenv import load_dotenv
+from app.services.upstream import gemini_limiter
+from app.services.http_client import get_http_client
+from app.services.batching import MicroBatcher
+from app.responses import decode_json
+from app.config import settings
 
 load_dotenv()
 
@@ -13,25 +17,86 @@ logger = logging.getLogger(__name__)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_ENDPOINT = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
 
+# Micro-batching: summaries arriving within BATCH_MAX_DELAY seconds share one Gemini call
+BATCH_MAX_SIZE = settings.gemini_batch_max_size
+BATCH_MAX_DELAY = settings.gemini_batch_max_delay_ms / 1000
+BATCH_DELIMITER = "###"
+
+# Static per-style preambles. They always open the prompt, with nothing request-specific
+# before them, so Gemini's prefix cache can reuse them across requests of the same style.
+STYLE_PREFIXES = {
+    "descriptive": "You summarize image descriptions. Create a detailed, engaging summary focusing on visual elements, composition, and atmosphere.\n---\n",
+    "technical": "You summarize image descriptions. Provide a technical analysis focusing on objects, layout, colors, and photographic elements.\n---\n",
+    "creative": "You summarize image descriptions. Write a creative, artistic interpretation using vivid language, focusing on mood and storytelling.\n---\n",
+    "concise": "You summarize image descriptions. Summarize very concisely, covering just the key elements.\n---\n",
+    "contextual": "You summarize image descriptions. Provide context about what the image might be used for, where it might be found, or what category it belongs to.\n---\n"
+}
+
+class BatchedGemini(MicroBatcher):
+    """Coalesce concurrent summary requests into one Gemini call per style"""
+    
+    def __init__(self, max_batch: int = BATCH_MAX_SIZE, max_delay: float = BATCH_MAX_DELAY):
+        super().__init__(max_batch, max_delay)
+    
+    async def run_batch(self, items: List[Tuple]):
+        """Split a batch by style and resolve each group concurrently"""
+        groups: Dict[str, List[Tuple]] = {}
+        for item in items:
+            groups.setdefault(item[2], []).append(item)
+        
+        await asyncio.gather(*(self.run_group(style, group) for style, group in groups.items()))
+    
+    async def run_group(self, style: str, items: List[Tuple]):
+        """Resolve one style group with a single Gemini call, falling back to individual calls"""
+        if len(items) > 1:
+            try:
+                summaries = await generate_summaries_with_gemini(
+                    [(caption, max_length) for caption, max_length, _, _ in items],
+                    style
+                )
+                for (_, _, _, future), summary in zip(items, summaries):
+                    if not future.done():
+                        future.set_result(summary)
+                return
+            except Exception as e:
+                logger.warning(f"Batched Gemini call failed for {len(items)} {style} summaries, retrying individually: {e}")
+        
+        async def resolve(caption: str, max_length: int, future: asyncio.Future):
+            try:
+                summary = await generate_summary_with_gemini(caption, max_length, style)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(summary)
+        
+        await asyncio.gather(*(resolve(caption, max_length, future) for caption, max_length, _, future in items))
+
+gemini_batcher = BatchedGemini()
+
 async def generate_summary(
     caption: str, 
     max_length: int = 150, 
     style: str = "descriptive"
-) -> str:
-    """Generate an enhanced summary from image caption using Google Gemini"""
+) -> Tuple[str, bool]:
+    """Generate an enhanced summary from image caption using Google Gemini
+    
+    Returns the summary and whether it came from the template fallback rather than Gemini.
+    """
     try:
         # If Gemini API key is available, use it
         if GEMINI_API_KEY:
-            return await generate_summary_with_gemini(caption, max_length, style)
+            return await gemini_batcher.submit(caption, max_length, style), False
         else:
             # Fallback to simple template-based generation
             logger.warning("No Gemini API key found. Using fallback generation.")
-            return await generate_summary_fallback(caption, max_length, style)
+            return await generate_summary_fallback(caption, max_length, style), True
         
     except Exception as e:
         logger.error(f"Error generating summary: {e}")
         # Fallback to simple generation if Gemini fails
-        return await generate_summary_fallback(caption, max_length, style)
+        return await generate_summary_fallback(caption, max_length, style), True
 
 async def generate_summary_with_gemini(
     caption: str, 
@@ -40,20 +105,9 @@ async def generate_summary_with_gemini(
 ) -> str:
     """Generate summary using Google Gemini API"""
     try:
-        # Create style-specific prompts
-        style_prompts = {
-            "descriptive": f"Analyze this image description and create a detailed, engaging summary in {max_length} characters or less: '{caption}'. Focus on visual elements, composition, and atmosphere.",
-            
-            "technical": f"Provide a technical analysis of this image description in {max_length} characters or less: '{caption}'. Focus on objects, layout, colors, and photographic elements.",
-            
-            "creative": f"Write a creative, artistic interpretation of this image description in {max_length} characters or less: '{caption}'. Use vivid language and focus on mood and storytelling.",
-            
-            "concise": f"Summarize this image description in {max_length} characters or less, being very concise: '{caption}'. Just the key elements.",
-            
-            "contextual": f"Analyze this image description and provide context about what this might be used for, where it might be found, or what category it belongs to in {max_length} characters or less: '{caption}'"
-        }
-        
-        prompt = style_prompts.get(style, style_prompts["descriptive"])
+        # Shared style prefix first, request-specific details last
+        prefix = STYLE_PREFIXES.get(style, STYLE_PREFIXES["descriptive"])
+        prompt = f"{prefix}Answer in {max_length} characters or less.\nDescription: '{caption}'"
         
         # Prepare request payload
         payload = {
@@ -76,8 +130,9 @@ async def generate_summary_with_gemini(
             "x-goog-api-key": GEMINI_API_KEY
         }
         
-        # Make request to Gemini API
-        response = requests.post(
+        # Make request to Gemini API (rate-limited, over the shared connection pool)
+        response = await gemini_limiter.call(
+            get_http_client().post,
             f"{GEMINI_ENDPOINT}?key={GEMINI_API_KEY}",
             json=payload,
             headers=headers,
@@ -85,7 +140,7 @@ async def generate_summary_with_gemini(
         )
         
         if response.status_code == 200:
-            result = response.json()
+            result = decode_json(response.content)
             
             if "candidates" in result and len(result["candidates"]) > 0:
                 summary = result["candidates"][0]["content"]["parts"][0]["text"].strip()
@@ -105,6 +160,99 @@ async def generate_summary_with_gemini(
         logger.error(f"Error with Gemini API: {e}")
         raise
 
+async def generate_summaries_with_gemini(
+    items: List[Tuple[str, int]],
+    style: str = "descriptive"
+) -> List[str]:
+    """Generate several same-style summaries with a single Gemini call"""
+    prefix = STYLE_PREFIXES.get(style, STYLE_PREFIXES["descriptive"])
+    descriptions = "\n".join(
+        f"{i}. ({max_length} characters or less) '{caption}'"
+        for i, (caption, max_length) in enumerate(items, 1)
+    )
+    prompt = (
+        f"{prefix}Summarize each numbered description below. "
+        f"Answer in the same order, one summary per description, separated by a line containing only {BATCH_DELIMITER}. "
+        f"Do not number the summaries.\n\n{descriptions}"
+    )
+    
+    payload = {
+        "contents": [{
+            "parts": [{
+                "text": prompt
+            }]
+        }],
+        "generationConfig": {
+            "temperature": 0.7,
+            "topK": 40,
+            "topP": 0.95,
+            "maxOutputTokens": sum(max_length // 4 for _, max_length in items) + 8 * len(items),
+            "stopSequences": []
+        }
+    }
+    
+    headers = {
+        "Content-Type": "application/json",
+        "x-goog-api-key": GEMINI_API_KEY
+    }
+    
+    response = await gemini_limiter.call(
+        get_http_client().post,
+        f"{GEMINI_ENDPOINT}?key={GEMINI_API_KEY}",
+        json=payload,
+        headers=headers,
+        timeout=15
+    )
+    
+    if response.status_code != 200:
+        raise Exception(f"Gemini API error: {response.status_code} - {response.text}")
+    
+    result = decode_json(response.content)
+    if not result.get("candidates"):
+        raise Exception("No summaries generated by Gemini")
+    
+    text = result["candidates"][0]["content"]["parts"][0]["text"]
+    summaries = [part.strip() for part in text.split(BATCH_DELIMITER) if part.strip()]
+    if len(summaries) != len(items):
+        raise Exception(f"Expected {len(items)} summaries, got {len(summaries)}")
+    
+    for i, (_, max_length) in enumerate(items):
+        if len(summaries[i]) > max_length:
+            summaries[i] = summaries[i][:max_length-3] + "..."
+    
+    logger.info(f"Generated {len(items)} {style} summaries in one Gemini call")
+    return summaries
+
+async def warm_prompt_prefixes():
+    """Send one tiny request per style so Gemini has each shared prefix cached before real traffic"""
+    if not GEMINI_API_KEY:
+        return
+    
+    async def warm(style: str, prefix: str):
+        payload = {
+            "contents": [{
+                "parts": [{
+                    "text": f"{prefix}Reply with OK."
+                }]
+            }],
+            "generationConfig": {
+                "maxOutputTokens": 1
+            }
+        }
+        try:
+            await gemini_limiter.call(
+                get_http_client().post,
+                f"{GEMINI_ENDPOINT}?key={GEMINI_API_KEY}",
+                json=payload,
+                headers={"Content-Type": "application/json"},
+                timeout=10
+            )
+        except Exception as e:
+            logger.warning(f"Prompt prefix warm-up failed for {style}: {e}")
+    
+    await asyncio.gather(*(warm(style, prefix) for style, prefix in STYLE_PREFIXES.items()))
+    logger.info(f"Warmed {len(STYLE_PREFIXES)} Gemini prompt prefixes")
+
 async def generate_summary_fallback(
     caption: str, 
     max_length: int = 150, 
@@ -136,8 +284,11 @@ async def generate_summary_fallback(
         logger.error(f"Error generating fallback summary: {e}")
         return f"Summary: {caption}"
 
-async def enhance_caption_context(caption: str) -> str:
-    """Enhance caption with better context for search queries"""
+async def enhance_caption_context(caption: str) -> Tuple[str, bool]:
+    """Enhance caption with better context for search queries
+    
+    Returns the enhanced caption and whether it came from the rules-based fallback rather than Gemini.
+    """
     try:
         if GEMINI_API_KEY:
             prompt = f"""
@@ -171,7 +322,8 @@ async def enhance_caption_context(caption: str) -> str:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
+            response = await gemini_limiter.call(
+                get_http_client().post,
                 f"{GEMINI_ENDPOINT}?key={GEMINI_API_KEY}",
                 json=payload,
                 headers=headers,
@@ -179,7 +331,7 @@ async def enhance_caption_context(caption: str) -> str:
             )
             
             if response.status_code == 200:
-                result = response.json()
+                result = decode_json(response.content)
                 if "candidates" in result and len(result["candidates"]) > 0:
                     enhanced = result["candidates"][0]["content"]["parts"][0]["text"].strip()
                     # Clean up the response
@@ -188,14 +340,14 @@ async def enhance_caption_context(caption: str) -> str:
                         enhanced = enhanced[:47] + "..."
                     
                     logger.info(f"Enhanced caption: '{caption}' -> '{enhanced}'")
-                    return enhanced
+                    return enhanced, False
         
         # Fallback enhancement
-        return enhance_caption_fallback(caption)
+        return enhance_caption_fallback(caption), True
         
     except Exception as e:
         logger.error(f"Error enhancing caption: {e}")
-        return enhance_caption_fallback(caption)
+        return enhance_caption_fallback(caption), True
 
 def enhance_caption_fallback(caption: str) -> str:
     """Fallback caption enhancement"""
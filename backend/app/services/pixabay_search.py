@@ -1,8 +1,14 @@
 import os
+import time
 import logging
 from typing import List, Dict, Optional
-import requests
+import httpx
 from dotenv import load_dotenv
+from app.services.upstream import pixabay_limiter
+from app.services.http_client import get_http_client
+from app.cache import MemoryCache
+from app.responses import decode_json
+from app.config import settings
 
 load_dotenv()
 
@@ -11,6 +17,29 @@ logger = logging.getLogger(__name__)
 PIXABAY_API_KEY = os.getenv("PIXABAY_API_KEY", "")
 PIXABAY_ENDPOINT = "https://pixabay.com/api/"
 
+# Fail fast on connect so a slow Pixabay falls back to demo results instead of stalling the search
+PIXABAY_TIMEOUT = httpx.Timeout(10.0, connect=3.0)
+
+# Stock results change slowly, so identical queries reuse them until the TTL expires
+results_cache = MemoryCache(default_ttl=settings.pixabay_cache_ttl, maxsize=settings.pixabay_cache_max_items)
+
+# Idle pooled connections are dropped after this long (httpx default keep-alive expiry)
+KEEPALIVE_EXPIRY = 5.0
+last_used = 0.0
+
+async def warm_connection():
+    """Open a pooled connection to Pixabay ahead of a search if the last one has likely expired"""
+    global last_used
+    
+    if not PIXABAY_API_KEY or time.monotonic() - last_used < KEEPALIVE_EXPIRY:
+        return
+    
+    last_used = time.monotonic()
+    try:
+        await get_http_client().head(PIXABAY_ENDPOINT, timeout=5)
+    except httpx.HTTPError as e:
+        logger.debug(f"Pixabay connection warm-up failed: {e}")
+
 async def search_similar_images_pixabay(
     query: str,
     count: int = 10,
@@ -26,50 +55,20 @@ async def search_similar_images_pixabay(
         logger.warning("No Pixabay API key found. Using demo mode with sample results.")
         return get_demo_results(query, count)
     
+    cache_key = f"{query.strip().lower()}|{count}|{image_type}|{category}|{min_width}"
+    cached_results = results_cache.get(cache_key)
+    if cached_results is not None:
+        logger.info(f"Using cached Pixabay results for query: '{query}'")
+        return cached_results
+    
     try:
-        params = {
-            'key': PIXABAY_API_KEY,
-            'q': query,
-            'image_type': image_type,  # "all", "photo", "illustration", "vector"
-            'orientation': 'all',      # "all", "horizontal", "vertical"
-            'category': category,      # "backgrounds", "fashion", "nature", "science", "education", etc.
-            'min_width': min_width,
-            'min_height': 480,
-            'per_page': min(count, 200),  # Pixabay allows max 200 per request
-            'safesearch': 'true',
-            'order': 'popular'         # "popular", "latest", "ec" (Editor's Choice)
-        }
-        
-        logger.info(f"Searching Pixabay for images with query: '{query}'")
-        
-        response = requests.get(PIXABAY_ENDPOINT, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        images = data.get('hits', [])
-        
-        # Format results
-        results = []
-        for img in images:
-            result = {
-                "url": img.get("largeImageURL", img.get("fullHDURL", img.get("webformatURL", ""))),
-                "thumbnail": img.get("previewURL", ""),
-                "title": img.get("tags", f"Image about {query}"),
-                "source": f"pixabay.com/photos/{img.get('id', '')}",
-                "width": img.get("imageWidth", 0),
-                "height": img.get("imageHeight", 0),
-                "size": f"{img.get('imageSize', 0)} bytes",
-                "downloads": img.get("downloads", 0),
-                "likes": img.get("likes", 0),
-                "user": img.get("user", "Unknown"),
-                "tags": img.get("tags", "").split(", ")
-            }
-            results.append(result)
-        
-        logger.info(f"Found {len(results)} images from Pixabay")
-        return results
+        # Concurrent misses for the same query share one Pixabay call
+        return await results_cache.get_or_compute(
+            cache_key,
+            lambda: fetch_pixabay(query, count, image_type, category, min_width)
+        )
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Error calling Pixabay API: {e}")
         # Fallback to demo mode
         logger.info("Falling back to demo mode")
@@ -78,6 +77,68 @@ async def search_similar_images_pixabay(
         logger.error(f"Error processing Pixabay results: {e}")
         return get_demo_results(query, count)
 
+async def fetch_pixabay(
+    query: str,
+    count: int,
+    image_type: str,
+    category: str,
+    min_width: int
+) -> List[Dict]:
+    """Call the Pixabay API and format its hits"""
+    global last_used
+    
+    params = {
+        'key': PIXABAY_API_KEY,
+        'q': query,
+        'image_type': image_type,  # "all", "photo", "illustration", "vector"
+        'orientation': 'all',      # "all", "horizontal", "vertical"
+        'category': category,      # "backgrounds", "fashion", "nature", "science", "education", etc.
+        'min_width': min_width,
+        'min_height': 480,
+        'per_page': min(count, 200),  # Pixabay allows max 200 per request
+        'safesearch': 'true',
+        'order': 'popular'         # "popular", "latest", "ec" (Editor's Choice)
+    }
+    
+    logger.info(f"Searching Pixabay for images with query: '{query}'")
+    
+    response = await pixabay_limiter.call(get_http_client().get, PIXABAY_ENDPOINT, params=params, timeout=PIXABAY_TIMEOUT)
+    last_used = time.monotonic()
+    response.raise_for_status()
+    
+    data = decode_json(response.content)
+    images = data.get('hits', [])
+    
+    # Format results
+    results = []
+    for img in images:
+        result = {
+            "url": img.get("largeImageURL", img.get("fullHDURL", img.get("webformatURL", ""))),
+            "thumbnail": img.get("previewURL", ""),
+            "title": img.get("tags", f"Image about {query}"),
+            "source": f"pixabay.com/photos/{img.get('id', '')}",
+            "width": img.get("imageWidth", 0),
+            "height": img.get("imageHeight", 0),
+            "size": f"{img.get('imageSize', 0)} bytes",
+            "downloads": img.get("downloads", 0),
+            "likes": img.get("likes", 0),
+            "user": img.get("user", "Unknown"),
+            "tags": img.get("tags", "").split(", ")
+        }
+        results.append(result)
+    
+    logger.info(f"Found {len(results)} images from Pixabay")
+    return results
+
+# Demo placeholders: (background colour, downloads, likes); only the query-dependent fields vary per call
+DEMO_TEMPLATES = (
+    ("0066cc", 100, 50),
+    ("cc6600", 80, 40),
+    ("009966", 120, 60),
+    ("cc0066", 90, 45),
+    ("6600cc", 110, 55)
+)
+
 def get_demo_results(query: str, count: int) -> List[Dict]:
     """
     Get demo/placeholder results when API is not available
@@ -85,82 +146,27 @@ def get_demo_results(query: str, count: int) -> List[Dict]:
     try:
         logger.info(f"Generating {count} demo results for query: '{query}'")
         
-        demo_images = [
-            {
-                "url": f"https://via.placeholder.com/800x600/0066cc/ffffff?text={query.replace(' ', '+')}+1",
-                "thumbnail": f"https://via.placeholder.com/150x150/0066cc/ffffff?text=1",
-                "title": f"Demo image about {query} #1",
-                "source": "demo.placeholder.com",
-                "width": 800,
-                "height": 600,
-                "size": "Demo image",
-                "downloads": 100,
-                "likes": 50,
-                "user": "Demo User",
-                "tags": query.split() + ["demo", "placeholder"]
-            },
-            {
-                "url": f"https://via.placeholder.com/800x600/cc6600/ffffff?text={query.replace(' ', '+')}+2",
-                "thumbnail": f"https://via.placeholder.com/150x150/cc6600/ffffff?text=2",
-                "title": f"Demo image about {query} #2",
-                "source": "demo.placeholder.com",
-                "width": 800,
-                "height": 600,
-                "size": "Demo image",
-                "downloads": 80,
-                "likes": 40,
-                "user": "Demo User",
-                "tags": query.split() + ["demo", "placeholder"]
-            },
-            {
-                "url": f"https://via.placeholder.com/800x600/009966/ffffff?text={query.replace(' ', '+')}+3",
-                "thumbnail": f"https://via.placeholder.com/150x150/009966/ffffff?text=3",
-                "title": f"Demo image about {query} #3",
-                "source": "demo.placeholder.com",
-                "width": 800,
-                "height": 600,
-                "size": "Demo image",
-                "downloads": 120,
-                "likes": 60,
-                "user": "Demo User",
-                "tags": query.split() + ["demo", "placeholder"]
-            },
-            {
-                "url": f"https://via.placeholder.com/800x600/cc0066/ffffff?text={query.replace(' ', '+')}+4",
-                "thumbnail": f"https://via.placeholder.com/150x150/cc0066/ffffff?text=4",
-                "title": f"Demo image about {query} #4",
-                "source": "demo.placeholder.com",
-                "width": 800,
-                "height": 600,
-                "size": "Demo image",
-                "downloads": 90,
-                "likes": 45,
-                "user": "Demo User",
-                "tags": query.split() + ["demo", "placeholder"]
-            },
-            {
-                "url": f"https://via.placeholder.com/800x600/6600cc/ffffff?text={query.replace(' ', '+')}+5",
-                "thumbnail": f"https://via.placeholder.com/150x150/6600cc/ffffff?text=5",
-                "title": f"Demo image about {query} #5",
+        url_query = query.replace(' ', '+')
+        tags = query.split() + ["demo", "placeholder"]
+        
+        # Repeat the templates to meet the requested count
+        result_list = []
+        for i in range(count):
+            color, downloads, likes = DEMO_TEMPLATES[i % len(DEMO_TEMPLATES)]
+            number = i % len(DEMO_TEMPLATES) + 1
+            result_list.append({
+                "url": f"https://via.placeholder.com/800x600/{color}/ffffff?text={url_query}+{number}",
+                "thumbnail": f"https://via.placeholder.com/150x150/{color}/ffffff?text={number}",
+                "title": f"Demo image about {query} #{number}",
                 "source": "demo.placeholder.com",
                 "width": 800,
                 "height": 600,
                 "size": "Demo image",
-                "downloads": 110,
-                "likes": 55,
+                "downloads": downloads,
+                "likes": likes,
                 "user": "Demo User",
-                "tags": query.split() + ["demo", "placeholder"]
-            }
-        ]
-        
-        # Ensure we have enough results
-        if count <= len(demo_images):
-            result_list = demo_images[:count]
-        else:
-            # Repeat the demo images to meet the requested count
-            multiplier = (count // len(demo_images)) + 1
-            extended_list = demo_images * multiplier
-            result_list = extended_list[:count]
+                "tags": list(tags)
+            })
         
         logger.info(f"Generated {len(result_list)} demo results")
         return result_list
@@ -181,10 +187,6 @@ def get_demo_results(query: str, count: int) -> List[Dict]:
             "user": "Error User",
             "tags": ["error", "demo"]
         }]
-    
-    # Return requested number of demo results
-    result_list = demo_images * ((count // len(demo_images)) + 1)
-    return result_list[:count]
 
 def get_search_suggestions(query: str) -> List[str]:
     """
@@ -199,17 +201,19 @@ def get_search_suggestions(query: str) -> List[str]:
     ]
     return suggestions[:3]
 
+# Common words that don't help with search
+STOP_WORDS = frozenset({"the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by"})
+
 async def search_by_image_description(description: str, count: int = 10) -> Dict:
     """
     Search for images using a description (from image captioning)
     """
     try:
-        # Clean and enhance the description for better search results
-        enhanced_query = description.replace("a photo of", "").replace("an image of", "").strip()
+        # Clean and enhance the description for better search results (Pixabay search is case-insensitive)
+        enhanced_query = description.replace("a photo of", "").replace("an image of", "").strip().lower()
         
         # Remove common words that don't help with search
-        stop_words = ["the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by"]
-        query_words = [word for word in enhanced_query.split() if word.lower() not in stop_words]
+        query_words = [word for word in enhanced_query.split() if word not in STOP_WORDS]
         enhanced_query = " ".join(query_words)
         
         results = await search_similar_images_pixabay(
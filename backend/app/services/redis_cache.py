@@ -0,0 +1,110 @@
+"""
+Shared response cache backed by Redis, with the in-process MemoryCache as fallback
+"""
+import logging
+from typing import Any, Awaitable, Callable, Optional
+from app.config import settings
+from app.cache import cache, hexdigest
+from app.responses import encode_json
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as redis_asyncio
+    redis_available = True
+except ImportError:
+    logger.warning("redis library not available. Install with: pip install redis")
+    redis_available = False
+
+try:
+    import orjson
+    loads_json = orjson.loads
+except ImportError:
+    import json
+    loads_json = json.loads
+
+# Global Redis client (created lazily from REDIS_URL)
+redis_client = None
+
+def get_redis():
+    """Get the shared Redis client, or None when Redis is not configured"""
+    global redis_client
+    
+    if redis_client is None and redis_available and settings.redis_url:
+        pool = redis_asyncio.ConnectionPool.from_url(
+            settings.redis_url,
+            max_connections=settings.redis_max_connections
+        )
+        redis_client = redis_asyncio.Redis(connection_pool=pool)
+        logger.info("Connected Redis response cache")
+    
+    return redis_client
+
+async def close_redis() -> None:
+    """Close the shared Redis client"""
+    global redis_client
+    
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+
+def normalize_caption(caption: str) -> str:
+    """Lowercase and collapse whitespace so trivially different captions share a cache entry"""
+    # split()/join()/lower() run in C, so this stays cheap even for long captions
+    return " ".join(caption.split()).lower()
+
+def make_key(namespace: str, *parts: Any) -> str:
+    """Build a compact cache key from a namespace and the values that identify a result"""
+    return f"{namespace}:" + hexdigest("|".join(str(part) for part in parts).encode())
+
+async def get_json(key: str) -> Optional[Any]:
+    """Get a cached JSON value"""
+    client = get_redis()
+    if client is None:
+        return cache.get(key)
+    
+    try:
+        raw = await client.get(key)
+    except Exception as e:
+        logger.warning(f"Redis GET failed for {key[:16]}...: {e}")
+        return None
+    
+    return loads_json(raw) if raw is not None else None
+
+async def set_json(key: str, value: Any, ttl: int) -> None:
+    """Cache a JSON-serializable value for ttl seconds"""
+    client = get_redis()
+    if client is None:
+        cache.set(key, value, ttl=ttl)
+        return
+    
+    try:
+        await client.set(key, encode_json(value), ex=ttl)
+    except Exception as e:
+        logger.warning(f"Redis SET failed for {key[:16]}...: {e}")
+
+def caption_key(image_hash: str) -> str:
+    """Cache key for the BLIP caption of an image, from its content digest"""
+    # Model, beam count and INT8 quantization are part of the key, since changing any of them changes the caption
+    return make_key("caption", settings.blip_model_name, settings.caption_num_beams, settings.caption_int8, image_hash)
+
+async def get_caption(image_hash: str) -> Optional[str]:
+    """Get the cached caption for an image digest"""
+    return await get_json(caption_key(image_hash))
+
+async def set_caption(image_hash: str, caption: str) -> None:
+    """Cache the caption for an image digest"""
+    await set_json(caption_key(image_hash), caption, settings.caption_cache_ttl)
+
+async def get_or_compute_caption(image_hash: str, factory: Callable[[], Awaitable[str]]) -> str:
+    """Get the cached caption for an image digest, captioning it once across concurrent requests on a miss"""
+    caption = await get_caption(image_hash)
+    if caption is not None:
+        return caption
+    
+    async def produce() -> str:
+        caption = await factory()
+        await set_caption(image_hash, caption)
+        return caption
+    
+    return await cache.get_or_compute(caption_key(image_hash), produce, ttl=settings.caption_cache_ttl)
@@ -1,12 +1,22 @@
 from fastapi import UploadFile
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Optional approximate nearest-neighbour index for large image stores
+try:
+    import faiss
+    faiss_available = True
+except ImportError:
+    logger.info("FAISS not available, image search uses exact scoring. Install with: pip install faiss-cpu")
+    faiss_available = False
+
 # Check if CLIP is available
 try:
-    from app.services.clip import get_image_embedding, get_text_embedding, calculate_similarity
+    from app.services.clip import get_image_embedding, get_text_embedding
     CLIP_AVAILABLE = True
     logger.info("CLIP services available for search")
 except ImportError as e:
@@ -19,12 +29,143 @@ except ImportError as e:
     
     def get_text_embedding(text: str):
         raise Exception("CLIP library not available. Install with: pip install git+https://github.com/openai/CLIP.git")
+
+# CLIP embeddings arrive L2-normalized; fp16 inference leaves them this close to unit length
+UNIT_NORM_TOLERANCE = 1e-2
+
+# Rows scored per step when stored embeddings have to be widened back to float32
+SCORE_BLOCK_ROWS = 8192
+
+class EmbeddingStore:
+    """Image embeddings as one contiguous (N, D) matrix of L2-normalized rows, plus per-row entries
     
-    def calculate_similarity(emb1, emb2):
-        raise Exception("CLIP library not available. Install with: pip install git+https://github.com/openai/CLIP.git")
+    Rows are kept as float32, float16 (half the memory) or int8 with a per-row scale (a quarter)
+    """
+    
+    def __init__(self, initial_capacity: int = 1024, storage: str = settings.embedding_storage):
+        if storage not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported embedding storage: {storage}")
+        self.initial_capacity = initial_capacity
+        self.storage = storage
+        self.clear()
+    
+    def clear(self):
+        """Drop all stored embeddings"""
+        self.matrix: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None  # int8 storage only
+        self.entries: List[Dict] = []
+        self.index = None
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    @property
+    def dimension(self) -> int:
+        return 0 if self.matrix is None else self.matrix.shape[1]
+    
+    def reserve(self, rows: int, dimension: int):
+        """Make room for at least rows embeddings, at least doubling capacity so appends stay amortized O(1)"""
+        if self.matrix is None:
+            capacity = max(self.initial_capacity, rows)
+            self.matrix = np.empty((capacity, dimension), dtype=self.storage)
+            self.scales = np.empty(capacity, dtype=np.float32)
+        elif rows > self.matrix.shape[0]:
+            size = len(self.entries)
+            capacity = max(self.matrix.shape[0] * 2, rows)
+            grown = np.empty((capacity, self.matrix.shape[1]), dtype=self.storage)
+            grown[:size] = self.matrix[:size]
+            self.matrix = grown
+            scales = np.empty(capacity, dtype=np.float32)
+            scales[:size] = self.scales[:size]
+            self.scales = scales
+    
+    def add(self, embedding: List[float], entry: Dict) -> int:
+        """Append a unit-norm embedding; returns its row"""
+        return self.add_many([embedding], [entry])[0]
+    
+    def add_many(self, embeddings: List[List[float]], entries: List[Dict]) -> List[int]:
+        """Append several unit-norm embeddings with at most one reallocation; returns their rows"""
+        if len(embeddings) != len(entries):
+            raise ValueError("embeddings and entries must have the same length")
+        if not embeddings:
+            return []
+        
+        vectors = np.stack([unit_vector(embedding) for embedding in embeddings])
+        start = len(self.entries)
+        stop = start + len(vectors)
+        self.reserve(stop, vectors.shape[1])
+        
+        if self.storage == "int8":
+            # Symmetric per-row quantization: the largest component maps to +/-127
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            self.matrix[start:stop] = np.round(vectors / scales[:, np.newaxis]).astype(np.int8)
+            self.scales[start:stop] = scales
+        else:
+            self.matrix[start:stop] = vectors
+        self.entries.extend(entries)
+        
+        if faiss_available:
+            if self.index is None:
+                # Inner product over normalized rows is cosine similarity
+                self.index = faiss.IndexHNSWFlat(vectors.shape[1], settings.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+                self.index.hnsw.efSearch = settings.hnsw_ef_search
+            self.index.add(vectors)
+        return list(range(start, stop))
+    
+    def search(self, query_embedding: List[float], limit: int, threshold: float) -> List[Tuple[int, float]]:
+        """Return (row, cosine similarity) for the best matches at or above threshold, best first"""
+        if not self.entries or limit <= 0:
+            return []
+        
+        if self.index is not None and len(self.entries) >= settings.ann_min_items:
+            return self.search_index(query_embedding, limit, threshold)
+        
+        similarities = self.score(unit_vector(query_embedding))
+        candidates = np.flatnonzero(similarities >= threshold)
+        if len(candidates) > limit:
+            # Partial selection is O(N); only the kept rows get sorted
+            candidates = candidates[np.argpartition(-similarities[candidates], limit - 1)[:limit]]
+        
+        order = candidates[np.argsort(-similarities[candidates], kind="stable")]
+        return [(int(row), float(similarities[row])) for row in order]
+    
+    def score(self, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity of a normalized query against every stored row"""
+        count = len(self.entries)
+        if self.storage == "float32":
+            return self.matrix[:count] @ query
+        
+        # NumPy has no BLAS path for float16/int8, so widen one block at a time and keep the query exact
+        similarities = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCORE_BLOCK_ROWS):
+            stop = min(start + SCORE_BLOCK_ROWS, count)
+            similarities[start:stop] = self.matrix[start:stop].astype(np.float32) @ query
+        if self.storage == "int8":
+            similarities *= self.scales[:count]
+        return similarities
+    
+    def search_index(self, query_embedding: List[float], limit: int, threshold: float) -> List[Tuple[int, float]]:
+        """Approximate search through the HNSW graph, sublinear in the number of stored images"""
+        self.index.hnsw.efSearch = max(settings.hnsw_ef_search, limit)
+        scores, rows = self.index.search(unit_vector(query_embedding)[np.newaxis, :], limit)
+        # FAISS pads missing neighbours with row -1; results are already best first
+        return [
+            (int(row), float(score))
+            for row, score in zip(rows[0], scores[0])
+            if row >= 0 and score >= threshold
+        ]
+
+def unit_vector(embedding: List[float]) -> np.ndarray:
+    """Return an embedding as float32, rejecting it unless it is already L2-normalized"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    if abs(norm - 1.0) > UNIT_NORM_TOLERANCE:
+        raise ValueError(f"Embedding must be unit-norm, got norm {norm:.4f}")
+    return vector
 
 # In-memory storage for image embeddings (use proper database in production)
-image_database: List[Dict] = []
+image_store = EmbeddingStore()
 
 async def search_similar_images(
     file: Optional[UploadFile] = None, 
@@ -37,7 +178,7 @@ async def search_similar_images(
         if not file and not query:
             raise ValueError("Either file or query must be provided")
         
-        if len(image_database) == 0:
+        if len(image_store) == 0:
             logger.warning("Image database is empty")
             return []
         
@@ -49,22 +190,16 @@ async def search_similar_images(
             query_embedding = get_text_embedding(query)
             query_type = "text"
         
-        # Calculate similarities
-        similarities = []
-        for idx, stored_image in enumerate(image_database):
-            similarity = calculate_similarity(query_embedding, stored_image["embedding"])
-            
-            if similarity >= similarity_threshold:
-                similarities.append({
-                    "id": stored_image.get("id", idx),
-                    "url": stored_image.get("url", f"image_{idx}"),
-                    "similarity": similarity,
-                    "metadata": stored_image.get("metadata", {})
-                })
-        
-        # Sort by similarity (descending) and limit results
-        similarities.sort(key=lambda x: x["similarity"], reverse=True)
-        results = similarities[:limit]
+        # One matrix-vector product scores every stored image
+        results = []
+        for idx, similarity in image_store.search(query_embedding, limit, similarity_threshold):
+            stored_image = image_store.entries[idx]
+            results.append({
+                "id": stored_image.get("id", idx),
+                "url": stored_image.get("url", f"image_{idx}"),
+                "similarity": similarity,
+                "metadata": stored_image.get("metadata", {})
+            })
         
         logger.info(f"Found {len(results)} similar images for {query_type} query")
         return results
@@ -79,13 +214,12 @@ async def add_image_to_database(file: UploadFile, image_url: str, metadata: Opti
         embedding = await get_image_embedding(file)
         
         image_entry = {
-            "id": len(image_database),
+            "id": len(image_store),
             "url": image_url,
-            "embedding": embedding,
             "metadata": metadata or {}
         }
         
-        image_database.append(image_entry)
+        image_store.add(embedding, image_entry)
         logger.info(f"Added image to database: {image_url}")
         
         return image_entry["id"]
@@ -97,12 +231,12 @@ async def add_image_to_database(file: UploadFile, image_url: str, metadata: Opti
 def get_database_stats() -> Dict:
     """Get statistics about the image database"""
     return {
-        "total_images": len(image_database),
-        "embedding_dimension": len(image_database[0]["embedding"]) if image_database else 0
+        "total_images": len(image_store),
+        "embedding_dimension": image_store.dimension,
+        "embedding_storage": image_store.storage
     }
 
 def clear_database():
     """Clear the image database (for testing/development)"""
-    global image_database
-    image_database = []
+    image_store.clear()
     logger.info("Cleared image database")
@@ -0,0 +1,194 @@
+"""
+Second-tier LLM response cache that matches near-duplicate captions by embedding similarity
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+import numpy as np
+from app.config import settings
+from app.cache import hexdigest
+from app.responses import encode_json
+from app.services.redis_cache import get_redis, loads_json
+
+logger = logging.getLogger(__name__)
+
+try:
+    from sentence_transformers import SentenceTransformer
+    sentence_transformers_available = True
+except ImportError:
+    logger.warning("sentence-transformers not available. Install with: pip install sentence-transformers")
+    sentence_transformers_available = False
+
+try:
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+    onnxruntime_available = True
+except ImportError:
+    onnxruntime_available = False
+
+INDEX_NAME = "semcache_idx"
+KEY_PREFIX = "semcache:"
+
+# Global embedding model and index state
+embedder = None
+embedding_dim = 0
+index_ready = False
+
+# In-process fallback: bucket -> recent (embedding, payload) pairs
+local_entries: Dict[str, Deque[Tuple[np.ndarray, Any]]] = {}
+
+class OnnxEmbedder:
+    """Sentence embedder running an exported (optionally int8-quantized) model on ONNX Runtime"""
+    
+    def __init__(self, model_path: str, tokenizer_name: str):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count() or 1
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.session.get_outputs()[0].shape[-1]
+    
+    def encode(self, texts, normalize_embeddings: bool = True) -> np.ndarray:
+        """Mean-pool token embeddings, matching sentence-transformers' encode()"""
+        single = isinstance(texts, str)
+        batch = self.tokenizer([texts] if single else list(texts), padding=True, truncation=True, max_length=256, return_tensors="np")
+        inputs = {name: value.astype(np.int64) for name, value in batch.items() if name in self.input_names}
+        hidden = self.session.run(None, inputs)[0]
+        
+        mask = batch["attention_mask"][..., None].astype(np.float32)
+        embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if normalize_embeddings:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        
+        return embeddings[0] if single else embeddings
+
+def use_onnx() -> bool:
+    """Check whether an exported ONNX embedder is configured and loadable"""
+    return bool(settings.semantic_cache_onnx_path) and onnxruntime_available
+
+def is_enabled() -> bool:
+    """Check whether the semantic cache can be used"""
+    return settings.semantic_cache_enabled and (use_onnx() or sentence_transformers_available)
+
+def load_embedder():
+    """Load the sentence embedding model once"""
+    global embedder, embedding_dim
+    
+    if embedder is None:
+        if use_onnx():
+            logger.info(f"Loading semantic cache ONNX model: {settings.semantic_cache_onnx_path}")
+            embedder = OnnxEmbedder(settings.semantic_cache_onnx_path, settings.semantic_cache_model)
+        else:
+            logger.info(f"Loading semantic cache model: {settings.semantic_cache_model}")
+            embedder = SentenceTransformer(settings.semantic_cache_model, device="cpu")
+        embedding_dim = embedder.get_sentence_embedding_dimension()
+        logger.info("Semantic cache model loaded successfully")
+    
+    return embedder
+
+def embed(text: str) -> np.ndarray:
+    """Embed a caption as a normalized float32 vector"""
+    return load_embedder().encode(text, normalize_embeddings=True).astype(np.float32)
+
+def bucket_for(namespace: str, *scope: Any) -> str:
+    """Bucket entries so summaries are never reused across styles or lengths"""
+    return hexdigest("|".join(str(part) for part in (namespace, *scope)).encode())
+
+async def ensure_index(client) -> bool:
+    """Create the RediSearch vector index if it does not exist yet"""
+    global index_ready
+    
+    if index_ready:
+        return True
+    
+    try:
+        await client.execute_command(
+            "FT.CREATE", INDEX_NAME, "ON", "HASH", "PREFIX", "1", KEY_PREFIX,
+            "SCHEMA",
+            "bucket", "TAG",
+            "emb", "VECTOR", "HNSW", "6",
+            "TYPE", "FLOAT32", "DIM", str(embedding_dim), "DISTANCE_METRIC", "COSINE"
+        )
+    except Exception as e:
+        if "already exists" not in str(e).lower():
+            logger.warning(f"Semantic cache index unavailable, using in-process cache: {e}")
+            return False
+    
+    index_ready = True
+    return True
+
+async def lookup(namespace: str, caption: str, *scope: Any) -> Tuple[Optional[Any], Optional[np.ndarray]]:
+    """Return a cached payload for a semantically similar caption, if any, and the caption's embedding
+    
+    Pass the embedding back to store() on a miss so the caption isn't encoded twice.
+    """
+    if not is_enabled():
+        return None, None
+    
+    emb = await asyncio.to_thread(embed, caption)
+    bucket = bucket_for(namespace, *scope)
+    client = get_redis()
+    
+    if client is not None and await ensure_index(client):
+        try:
+            reply = await client.execute_command(
+                "FT.SEARCH", INDEX_NAME,
+                f"(@bucket:{{{bucket}}})=>[KNN 1 @emb $v AS score]",
+                "PARAMS", "2", "v", emb.tobytes(),
+                "RETURN", "2", "score", "payload",
+                "DIALECT", "2"
+            )
+        except Exception as e:
+            logger.warning(f"Semantic cache search failed: {e}")
+            return None, emb
+        
+        if not reply or reply[0] == 0:
+            return None, emb
+        
+        fields = dict(zip(reply[2][::2], reply[2][1::2]))
+        similarity = 1.0 - float(fields[b"score"])
+        if similarity >= settings.semantic_cache_threshold:
+            return loads_json(fields[b"payload"]), emb
+        return None, emb
+    
+    entries = local_entries.get(bucket)
+    if not entries:
+        return None, emb
+    
+    matrix = np.stack([entry[0] for entry in entries])
+    scores = matrix @ emb
+    best = int(np.argmax(scores))
+    if scores[best] >= settings.semantic_cache_threshold:
+        return entries[best][1], emb
+    return None, emb
+
+async def store(namespace: str, caption: str, payload: Any, *scope: Any, emb: Optional[np.ndarray] = None) -> None:
+    """Remember a generated payload under the caption's embedding (computed here unless lookup() returned it)"""
+    if not is_enabled():
+        return
+    
+    if emb is None:
+        emb = await asyncio.to_thread(embed, caption)
+    bucket = bucket_for(namespace, *scope)
+    client = get_redis()
+    
+    if client is not None and await ensure_index(client):
+        key = f"{KEY_PREFIX}{uuid.uuid4().hex}"
+        try:
+            await client.hset(key, mapping={
+                "bucket": bucket,
+                "emb": emb.tobytes(),
+                "payload": encode_json(payload)
+            })
+            await client.expire(key, settings.llm_cache_ttl)
+        except Exception as e:
+            logger.warning(f"Semantic cache store failed: {e}")
+        return
+    
+    entries = local_entries.setdefault(bucket, deque(maxlen=settings.semantic_cache_max_items))
+    entries.append((emb, payload))
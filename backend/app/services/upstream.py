@@ -0,0 +1,74 @@
+"""
+Concurrency limits and retries for external API calls (Gemini, Pixabay)
+"""
+import asyncio
+import logging
+import random
+from typing import Any, Callable, Dict
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+class UpstreamLimiter:
+    """Queue calls to one provider in-process and retry throttled or failed responses"""
+    
+    def __init__(self, name: str, max_concurrency: int, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.retries = 0
+    
+    async def call(self, func: Callable, *args: Any, **kwargs: Any):
+        """Run an HTTP call under the concurrency limit (blocking callables go to a worker thread)"""
+        for attempt in range(self.max_retries + 1):
+            self.waiting += 1
+            try:
+                await self.semaphore.acquire()
+            finally:
+                self.waiting -= 1
+            
+            self.in_flight += 1
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    response = await func(*args, **kwargs)
+                else:
+                    response = await asyncio.to_thread(func, *args, **kwargs)
+            finally:
+                self.in_flight -= 1
+                self.semaphore.release()
+            
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            
+            delay = self.retry_delay(attempt, response.headers.get("Retry-After"))
+            self.retries += 1
+            logger.warning(f"{self.name} returned {response.status_code}, retrying in {delay:.2f}s ({attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(delay)
+    
+    def retry_delay(self, attempt: int, retry_after: Any = None) -> float:
+        """Exponential backoff with full jitter, honouring Retry-After when given in seconds"""
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+    
+    def get_stats(self) -> Dict:
+        """Get limiter statistics"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "retries": self.retries
+        }
+
+gemini_limiter = UpstreamLimiter("Gemini", settings.gemini_max_concurrency, settings.upstream_max_retries)
+pixabay_limiter = UpstreamLimiter("Pixabay", settings.pixabay_max_concurrency, settings.upstream_max_retries)
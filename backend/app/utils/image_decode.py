@@ -0,0 +1,117 @@
+"""
+Image decoding kept free of model imports so it can also run in worker processes
+"""
+import io
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Optional, Union
+import numpy as np
+from PIL import Image
+from app.config import settings
+from app.utils.uploads import read_upload
+
+logger = logging.getLogger(__name__)
+
+# Optional SIMD JPEG decoder (libjpeg-turbo)
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    jpeg_decoder = TurboJPEG()
+    turbojpeg_available = True
+except Exception as e:
+    logger.info(f"PyTurboJPEG not available, decoding JPEGs with Pillow: {e}")
+    jpeg_decoder = None
+    turbojpeg_available = False
+
+# Optional OpenCV decoder: returns arrays directly and bundles libjpeg-turbo
+try:
+    import cv2
+    cv2_available = True
+except ImportError:
+    logger.info("OpenCV not available, decoding image arrays with Pillow")
+    cv2 = None
+    cv2_available = False
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+
+# Reject decompression bombs before Pillow allocates the full bitmap
+Image.MAX_IMAGE_PIXELS = settings.max_image_pixels
+
+def check_image_size(contents: Union[bytes, memoryview]) -> None:
+    """Apply Pillow's decompression-bomb limit from the header alone, for decoders that bypass Pillow"""
+    with Image.open(io.BytesIO(contents)):
+        pass
+
+def load_image(contents: Union[bytes, memoryview]) -> Image.Image:
+    """Decode image bytes into an RGB PIL image"""
+    if turbojpeg_available and bytes(contents[:3]) == JPEG_MAGIC:
+        try:
+            check_image_size(contents)
+            return Image.fromarray(jpeg_decoder.decode(contents, pixel_format=TJPF_RGB))
+        except Image.DecompressionBombError:
+            raise
+        except Exception as e:
+            logger.warning(f"TurboJPEG decode failed, falling back to Pillow: {e}")
+    
+    # BytesIO shares a bytes buffer instead of copying it (a memoryview would be copied)
+    return Image.open(io.BytesIO(contents)).convert("RGB")
+
+def decode_image_array(contents: Union[bytes, memoryview]) -> np.ndarray:
+    """Decode image bytes straight into an RGB array (H, W, 3 uint8), skipping the PIL round-trip where possible"""
+    if turbojpeg_available or cv2_available:
+        check_image_size(contents)
+    
+    if turbojpeg_available and bytes(contents[:3]) == JPEG_MAGIC:
+        try:
+            return jpeg_decoder.decode(contents, pixel_format=TJPF_RGB)
+        except Exception as e:
+            logger.warning(f"TurboJPEG decode failed, falling back: {e}")
+    
+    if cv2_available:
+        # Ignore EXIF orientation so pixels match what Pillow decodes
+        array = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if array is not None:
+            return cv2.cvtColor(array, cv2.COLOR_BGR2RGB)
+    
+    return np.asarray(load_image(contents))
+
+class ImageCtx:
+    """One upload's bytes plus its decoded forms, each produced at most once and shared by every stage"""
+    
+    def __init__(self, raw: Union[bytes, memoryview]):
+        self.raw = raw
+        self._array: Optional[np.ndarray] = None
+        self._pil: Optional[Image.Image] = None
+        self._decode_lock = asyncio.Lock()
+    
+    @classmethod
+    async def from_upload(cls, file, max_bytes: Optional[int] = None, digest=None) -> "ImageCtx":
+        """Read an upload once (bounded by max_bytes, feeding digest if given) for every stage to share"""
+        if max_bytes is None:
+            max_bytes = settings.max_image_size
+        return cls(await read_upload(file, max_bytes, digest=digest))
+    
+    async def pil(self, executor: Optional[Executor] = None) -> Image.Image:
+        """RGB PIL image, decoded off the event loop (in `executor` when given) on first use"""
+        async with self._decode_lock:
+            if self._pil is None:
+                if self._array is not None:
+                    self._pil = Image.fromarray(self._array)
+                elif executor is None:
+                    self._pil = await asyncio.to_thread(load_image, self.raw)
+                else:
+                    self._array = await asyncio.get_running_loop().run_in_executor(
+                        executor, decode_image_array, bytes(self.raw)
+                    )
+                    self._pil = Image.fromarray(self._array)
+        return self._pil
+    
+    async def array(self) -> np.ndarray:
+        """RGB array (H, W, 3 uint8), decoded straight to an array when no PIL image exists yet"""
+        async with self._decode_lock:
+            if self._array is None:
+                if self._pil is not None:
+                    self._array = await asyncio.to_thread(np.asarray, self._pil)
+                else:
+                    self._array = await asyncio.to_thread(decode_image_array, self.raw)
+        return self._array
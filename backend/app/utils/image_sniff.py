@@ -0,0 +1,34 @@
+"""
+Image type detection from file signatures (magic numbers)
+"""
+from fastapi import UploadFile
+from typing import Optional
+from app.models import ImageFormat
+
+# Number of leading bytes needed to recognize every supported format
+SNIFF_LENGTH = 12
+
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ImageFormat.JPEG),
+    (b"\x89PNG\r\n\x1a\n", ImageFormat.PNG),
+    (b"GIF87a", ImageFormat.GIF),
+    (b"GIF89a", ImageFormat.GIF),
+)
+
+def sniff_image_format(header: bytes) -> Optional[ImageFormat]:
+    """Detect the image format from the first bytes of a file"""
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    
+    # WEBP: "RIFF" <4-byte size> "WEBP"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return ImageFormat.WEBP
+    
+    return None
+
+async def sniff_upload(file: UploadFile) -> Optional[ImageFormat]:
+    """Detect the format of an uploaded image without trusting its content_type"""
+    header = await file.read(SNIFF_LENGTH)
+    await file.seek(0)
+    return sniff_image_format(header)
@@ -0,0 +1,26 @@
+"""
+CPU thread budget for PyTorch inference
+"""
+import logging
+import torch
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+def configure_cpu_threads(share: int = 1) -> None:
+    """Size PyTorch's intra-op pool, splitting it evenly when share processes run models side by side"""
+    if settings.torch_threads <= 0 and share <= 1:
+        return
+    
+    total = settings.torch_threads if settings.torch_threads > 0 else torch.get_num_threads()
+    threads = max(1, total // max(1, share))
+    torch.set_num_threads(threads)
+    
+    try:
+        # Requests already run concurrently, so inter-op parallelism only adds contention
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set before the first parallel op in the process
+        pass
+    
+    logger.info(f"PyTorch using {threads} CPU threads")
@@ -0,0 +1,61 @@
+"""
+Bounded, chunked reading of uploaded files
+"""
+import io
+import os
+from fastapi import UploadFile, File, HTTPException
+from app.config import settings
+from app.utils.image_sniff import sniff_upload
+
+# Read uploads in 64 KB chunks
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the allowed size"""
+
+async def read_upload(file: UploadFile, max_bytes: int, chunk_size: int = UPLOAD_CHUNK_SIZE, digest=None) -> bytes:
+    """Read an upload in chunks, aborting as soon as it grows past max_bytes
+    
+    If a hash object is given, each chunk is fed to it as it is read.
+    """
+    buffer = io.BytesIO()
+    total = 0
+    
+    while chunk := await file.read(chunk_size):
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+        buffer.write(chunk)
+        if digest is not None:
+            digest.update(chunk)
+    
+    # getvalue() hands back BytesIO's own bytes object (trimmed to size) rather than a copy, and
+    # decoders wrapping bytes in another BytesIO share them too; a memoryview would be copied there
+    return buffer.getvalue()
+
+def upload_size(file: UploadFile) -> int:
+    """Get the size of a spooled upload, seeking to its end when Starlette did not record it"""
+    if file.size is not None:
+        return file.size
+    
+    position = file.file.tell()
+    size = file.file.seek(0, os.SEEK_END)
+    file.file.seek(position)
+    return size
+
+async def validate_image_upload(file: UploadFile = File(...)) -> UploadFile:
+    """Dependency that rejects non-images and oversized uploads before any model work"""
+    # Validate file type from its signature rather than the client's content_type
+    if await sniff_upload(file) is None:
+        raise HTTPException(
+            status_code=415,
+            detail="File must be an image (JPEG, PNG, WEBP or GIF)"
+        )
+    
+    if upload_size(file) > settings.max_image_size:
+        raise HTTPException(
+            status_code=400,
+            detail="File size must be less than 10MB"
+        )
+    
+    return file
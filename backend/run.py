@@ -27,6 +27,8 @@ if __name__ == "__main__":
             host="0.0.0.0",
             port=8000,
             reload=True,
+            loop="uvloop" if sys.platform != "win32" else "auto",
+            http="httptools",
             log_level="info",
             access_log=True
         )